@@ -0,0 +1,214 @@
+"""
+ Benchmarks for weighslide.
+
+ Times calculate_weighted_windows for a range of series lengths, window lengths, NaN densities, statistics and
+ engines, and times the read, csv write, excel write and png stages of run_weighslide.
+ Results are saved as csv, with one row per measurement, so that results of different versions can be compared.
+ The weighslide version and git commit are recorded with the results. The benchmark can be run from a checkout of
+ the repository without installation, and then measures the weighslide package of the checkout.
+
+ Usage:
+ python benchmarks/benchmark_weighslide.py -o results_new.csv
+ python benchmarks/benchmark_weighslide.py --quick -o results_quick.csv
+ python benchmarks/benchmark_weighslide.py --compare results_old.csv results_new.csv
+"""
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import argparse
+import contextlib
+import importlib.util
+import io
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use("Agg")
+
+# use the weighslide package of this checkout, rather than an installed version
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_DIR))
+import weighslide
+
+# parameters of the full benchmark
+SERIES_LENGTHS = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6, 10 ** 7]
+WINDOW_LENGTHS = [3, 11, 37, 101, 501, 2001]
+NAN_FRACTIONS = [0.0, 0.1, 0.5]
+STATISTICS = ["mean", "std", "sum", "median", "max"]
+# statistics that can be calculated by the fft and numba engines
+FFT_STATISTICS = ["mean", "std", "sum"]
+ENGINES = ["direct", "fft", "numba"]
+# series lengths used for the run_weighslide stages
+STAGE_SERIES_LENGTHS = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5]
+
+# parameters of the quick benchmark
+QUICK_SERIES_LENGTHS = [10 ** 2, 10 ** 4]
+QUICK_WINDOW_LENGTHS = [11, 101]
+QUICK_NAN_FRACTIONS = [0.0, 0.1]
+QUICK_STAGE_SERIES_LENGTHS = [10 ** 2, 10 ** 3]
+
+
+def make_window(window_length):
+    """ Create a window string with one ignored position ("x") in every 4 positions, e.g. "393x393x393"."""
+    pattern = "393x"
+    return (pattern * (window_length // len(pattern) + 1))[:window_length]
+
+
+def make_data(series_length, nan_fraction, seed=0):
+    """ Create a random data series, with the given fraction of NaN values."""
+    rng = np.random.default_rng(seed)
+    data = rng.normal(size=series_length)
+    data[rng.random(series_length) < nan_fraction] = np.nan
+    return pd.Series(data)
+
+
+def time_function(function, repeats):
+    """ Return the fastest of several runs of a function, in seconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def get_repeats(seconds_estimate):
+    """ Use more repeats for fast measurements, to reduce noise."""
+    return 5 if seconds_estimate < 0.1 else 1
+
+
+def benchmark_engine(series_lengths, window_lengths, nan_fractions, statistics, engines, max_elements):
+    """ Time calculate_weighted_windows for all combinations of the parameters.
+
+    Combinations where series_length * window_length of the direct or numba engine exceeds max_elements are skipped.
+    The numba engine is skipped if numba is not installed.
+    """
+    rows = []
+    if "numba" in engines and importlib.util.find_spec("numba") is not None:
+        # compile the kernel of the numba engine before timing
+        weighslide.calculate_weighted_windows(make_data(100, 0.0), "393", "mean", full_output=False, engine="numba",
+                                              progress=False)
+    for series_length in series_lengths:
+        for nan_fraction in nan_fractions:
+            data_series = make_data(series_length, nan_fraction)
+            for window_length in window_lengths:
+                window = make_window(window_length)
+                for engine in engines:
+                    if engine != "fft" and series_length * window_length > max_elements:
+                        continue
+                    # the numba engine is optional
+                    if engine == "numba" and importlib.util.find_spec("numba") is None:
+                        continue
+                    for statistic in statistics:
+                        # order statistics are calculated by the direct engine only
+                        if engine != "direct" and statistic not in FFT_STATISTICS:
+                            continue
+
+                        def run():
+                            weighslide.calculate_weighted_windows(data_series, window, statistic, full_output=False,
+                                                                  engine=engine)
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            seconds = time_function(run, 1)
+                            repeats = get_repeats(seconds)
+                            if repeats > 1:
+                                seconds = time_function(run, repeats)
+                        rows.append({"benchmark": "engine", "stage": "calculate", "engine": engine,
+                                     "statistic": statistic, "series_length": series_length,
+                                     "window_length": window_length, "nan_fraction": nan_fraction,
+                                     "seconds": seconds})
+                        print("engine {:>6} {:>4} n={:<9} w={:<5} nan={:<4} {:.4f} s".format(
+                            engine, statistic, series_length, window_length, nan_fraction, seconds))
+    return rows
+
+
+def benchmark_stages(series_lengths, window_length=37):
+    """ Time the stages of run_weighslide (read, window, compute, csv_write, excel_write and plot)."""
+    rows = []
+    window = make_window(window_length)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for series_length in series_lengths:
+            data_series = make_data(series_length, 0.1)
+            infile = Path(temp_dir) / "data_{}.csv".format(series_length)
+            data_series.to_frame(name="data").to_csv(infile, index=False)
+            # the slices grow with the square of the series length, and are only included for short series
+            diagnostics = series_length <= 10 ** 2
+
+            metrics = weighslide.run_weighslide(infile, window, "mean", column="data", overwrite=True,
+                                                diagnostics=diagnostics, verbose=False)
+            timings = {record["stage"]: record["seconds"] for record in metrics.stages}
+
+            for stage, seconds in timings.items():
+                rows.append({"benchmark": "run_weighslide", "stage": stage, "engine": "auto", "statistic": "mean",
+                             "series_length": series_length, "window_length": window_length, "nan_fraction": 0.1,
+                             "seconds": seconds})
+                print("stage {:>12} n={:<9} {:.4f} s".format(stage, series_length, seconds))
+    return rows
+
+
+def get_weighslide_version():
+    """ Get the version in setup.py, and the git commit of the checkout ("-dirty" if it has uncommitted changes)."""
+    match = re.search(r"version='([^']+)'", (REPO_DIR / "setup.py").read_text())
+    version = match.group(1) if match is not None else "unknown"
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "unknown"
+    return version, commit
+
+
+def compare_results(old_csv, new_csv):
+    """ Compare two benchmark result files. Returns a dataframe with the ratio of new to old timings."""
+    keys = ["benchmark", "stage", "engine", "statistic", "series_length", "window_length", "nan_fraction"]
+    old_df = pd.read_csv(old_csv)
+    new_df = pd.read_csv(new_csv)
+    df = old_df[keys + ["seconds"]].merge(new_df[keys + ["seconds"]], on=keys, suffixes=("_old", "_new"))
+    df["ratio"] = df.seconds_new / df.seconds_old
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark weighslide.")
+    parser.add_argument("-o", "--output", default="weighslide_benchmark.csv",
+                        help="Path of the csv file with the results.")
+    parser.add_argument("--quick", action="store_true",
+                        help="Run a short benchmark with small series lengths.")
+    parser.add_argument("--max-elements", type=float, default=2e8,
+                        help="Skip direct and numba engine runs where series_length * window_length is larger "
+                             "than this.")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD_CSV", "NEW_CSV"),
+                        help="Compare two result files, instead of running the benchmark.")
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        df = compare_results(*args.compare)
+        print(df.to_string(index=False))
+        return
+
+    if args.quick:
+        rows = benchmark_engine(QUICK_SERIES_LENGTHS, QUICK_WINDOW_LENGTHS, QUICK_NAN_FRACTIONS, STATISTICS,
+                                ENGINES, args.max_elements)
+        rows += benchmark_stages(QUICK_STAGE_SERIES_LENGTHS)
+    else:
+        rows = benchmark_engine(SERIES_LENGTHS, WINDOW_LENGTHS, NAN_FRACTIONS, STATISTICS, ENGINES,
+                                args.max_elements)
+        rows += benchmark_stages(STAGE_SERIES_LENGTHS)
+
+    df = pd.DataFrame(rows)
+    # record the version and environment, so that results can be compared between versions and machines
+    df["weighslide"], df["commit"] = get_weighslide_version()
+    df["python"] = platform.python_version()
+    df["numpy"] = np.__version__
+    df["pandas"] = pd.__version__
+    df["machine"] = platform.machine()
+    df.to_csv(args.output, index=False)
+    print("Benchmark results saved to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -29,5 +29,8 @@ setup(name='weighslide',
           "Topic :: Scientific/Engineering :: Bio-Informatics"
       ],
       install_requires=["pandas", "numpy", "matplotlib", "pytest"],
+      extras_require={"parquet": ["pyarrow"], "numba": ["numba"]},
+      entry_points={"console_scripts": ["weighslide=weighslide.weighslide:main",
+                                        "weighslide-batch=weighslide.batch:main"]},
       keywords="sliding data normalisation normalization array"
       )
@@ -0,0 +1,98 @@
+from shutil import rmtree
+
+import numpy as np
+import pandas as pd
+
+from pathlib import Path
+from weighslide import run_weighslide_batch
+
+
+def test_batch():
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_batch"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    for n in range(3):
+        pd.DataFrame({"value": np.random.random_sample(30)}).to_csv(temp_output_dir / "sample{}.csv".format(n))
+    # a file without the "value" column fails, without stopping the batch
+    pd.DataFrame({"other": np.random.random_sample(30)}).to_csv(temp_output_dir / "broken.csv")
+
+    report = temp_output_dir / "report.csv"
+    summary_df = run_weighslide_batch(temp_output_dir, "494", "mean", processes=2, report=report, column="value",
+                                      diagnostics=False)
+    assert summary_df.infile.tolist() == [str(temp_output_dir / name) for name in
+                                          ["broken.csv", "sample0.csv", "sample1.csv", "sample2.csv"]]
+    assert summary_df.status.tolist() == ["failed", "finished", "finished", "finished"]
+    assert "KeyError" in summary_df.error[0]
+    assert report.is_file()
+    assert (temp_output_dir / "weighslide_output" / "sample1.csv494_mean.csv").is_file()
+
+    # outputs are up-to-date, and are skipped in a second run
+    summary_df = run_weighslide_batch(str(temp_output_dir / "sample*.csv"), "494", "mean", processes=1,
+                                      column="value", diagnostics=False)
+    assert summary_df.status.tolist() == ["skipped", "skipped", "skipped"]
+
+    # manifest with relative paths
+    (temp_output_dir / "manifest.txt").write_text("# samples\nsample0.csv\n\nsample2.csv\n")
+    summary_df = run_weighslide_batch(temp_output_dir / "manifest.txt", "494", "sum", processes=1, column="value")
+    assert summary_df.status.tolist() == ["finished", "finished"]
+
+    rmtree(temp_output_dir)
+
+
+def test_batch_settings_and_errors(capsys):
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_batch_settings"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"value": [4.0, 4.0, 4.0]}).to_csv(temp_output_dir / "s.csv")
+    out_csv = temp_output_dir / "weighslide_output" / "s.csv_sum.csv"
+
+    summary_df = run_weighslide_batch(temp_output_dir, [1, 1, 1], "sum", processes=1, column="value",
+                                      diagnostics=False, verbose=False)
+    assert summary_df.status.tolist() == ["finished"]
+    assert pd.read_csv(out_csv, index_col=0).iloc[1, 0] == 12.0
+    # the output filename is the same for all list windows, but the changed window is detected
+    summary_df = run_weighslide_batch(temp_output_dir, [5, 5, 5], "sum", processes=1, column="value",
+                                      diagnostics=False, verbose=False)
+    assert summary_df.status.tolist() == ["finished"]
+    assert pd.read_csv(out_csv, index_col=0).iloc[1, 0] == 60.0
+    summary_df = run_weighslide_batch(temp_output_dir, [5, 5, 5], "sum", processes=1, column="value",
+                                      diagnostics=False, verbose=False)
+    assert summary_df.status.tolist() == ["skipped"]
+    # other keyword arguments (e.g. engine) are also part of the settings
+    summary_df = run_weighslide_batch(temp_output_dir, [5, 5, 5], "sum", processes=1, column="value",
+                                      diagnostics=False, verbose=False, engine="direct")
+    assert summary_df.status.tolist() == ["finished"]
+    assert capsys.readouterr().out == ""
+
+    # arguments that cannot be sent to the worker processes give a failed row for each file
+    summary_df = run_weighslide_batch(temp_output_dir, "444", "sum", processes=2, column="value",
+                                      diagnostics=False, verbose=False, progress=lambda done, total: None)
+    assert summary_df.status.tolist() == ["failed"]
+    assert "pickle" in summary_df.error[0].lower()
+
+    rmtree(temp_output_dir)
+
+
+def test_batch_long_filenames_have_unique_outputs():
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_batch_names"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    # the filenames share the first 20 characters
+    infiles = [temp_output_dir / "sample_replicate_{:04d}.csv".format(n) for n in range(3)]
+    for n, infile in enumerate(infiles):
+        pd.DataFrame({"value": [float(n)] * 5}).to_csv(infile)
+
+    summary_df = run_weighslide_batch(temp_output_dir, "494", "mean", processes=2, column="value",
+                                      diagnostics=False, verbose=False)
+    assert summary_df.status.tolist() == ["finished"] * 3
+    for n, infile in enumerate(infiles):
+        out_csv = temp_output_dir / "weighslide_output" / "{}494_mean.csv".format(infile.name)
+        assert np.isclose(pd.read_csv(out_csv, index_col=0).iloc[2, 0], (0.5 * n + n + 0.5 * n) / 3)
+    summary_df = run_weighslide_batch(temp_output_dir, "494", "mean", processes=1, column="value",
+                                      diagnostics=False, verbose=False)
+    assert summary_df.status.tolist() == ["skipped"] * 3
+
+    # inputs with the same output files fail, instead of overwriting each other
+    summary_df = run_weighslide_batch([infiles[0], infiles[0], infiles[1]], "494", "mean", processes=1,
+                                      column="value", diagnostics=False, verbose=False, skip_up_to_date=False)
+    assert summary_df.status.tolist() == ["failed", "failed", "finished"]
+    assert "shared with 1 other" in summary_df.error[0]
+
+    rmtree(temp_output_dir)
@@ -0,0 +1,525 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from weighslide import calculate_weighted_windows, calculate_weighslide_result, calculate_weighted_windows_table
+from weighslide import calculate_weighted_windows_grouped, calculate_weighted_windows_2d
+from weighslide import calculate_weighted_windows_bank, ResultCache, WeighslideStream
+from weighslide import compile_window, WeighslideWindow
+from weighslide.weighslide import _parse_window, _parse_window_2d, _pad_data, _choose_engine
+from weighslide.weighslide import _weighted_windows_kernel
+
+
+def reference_weighted_windows(data, window_array, statistic):
+    """ Slow reference implementation, applying pandas statistics to one slice at a time."""
+    extension_each_side = int((len(window_array) - 1) / 2)
+    padded = pd.Series(np.concatenate([[np.nan] * extension_each_side, data, [np.nan] * extension_each_side]))
+    output = []
+    for i in range(len(data)):
+        win_multiplied = padded.iloc[i:i + len(window_array)].reset_index(drop=True) * window_array
+        if statistic[0] == "q":
+            output.append(win_multiplied.quantile(float(statistic[1:]) / 100))
+        else:
+            output.append(getattr(win_multiplied, statistic)())
+    return np.array(output)
+
+
+def test_docstring_example():
+    data_series = pd.Series([0, 0, 0, 1, 1, 2, 3, 5, 8, 13, 21])
+    output_series = calculate_weighted_windows(data_series, [2, 5, 2], "mean", full_output=False)
+    expected = [0.0, 0.0, 0.6667, 2.3333, 3.6667, 6.0, 9.6667, 15.6667, 25.3333, 41.0, 65.5]
+    assert np.allclose(output_series.values, expected, atol=1e-4)
+    assert output_series.name == "mean over window"
+    assert output_series.index.name == "position"
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+@pytest.mark.parametrize("window", ["4x4", "9xxxxx9xxxxx9", [1, 2, "x", 0.5, 3], [1]])
+def test_matches_reference(statistic, window):
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=60)
+    data[[0, 5, 6, 7, 30, 59]] = np.nan
+    window_array, df_orig_sliced, df_multiplied, output_series = calculate_weighted_windows(pd.Series(data), window,
+                                                                                            statistic)
+    expected = reference_weighted_windows(data, window_array, statistic)
+    assert np.allclose(output_series.values, expected, equal_nan=True)
+    assert df_orig_sliced.shape == (len(data) + len(window_array) - 1, len(data))
+    assert df_multiplied.shape == df_orig_sliced.shape
+
+
+@pytest.mark.parametrize("statistic", ["median", "min", "max", "q10", "q97.5"])
+@pytest.mark.parametrize("window", ["4444444", "4x4x4", [-2, -2, "x", -2, -2], "9xxxxx9xxxxx9", [1, 2, "x", 0.5, 3],
+                                    ["x", "x", "x"]])
+def test_order_statistics_match_reference(statistic, window):
+    rng = np.random.default_rng(3)
+    data = rng.normal(size=80)
+    data[[0, 5, 6, 7, 30, 79]] = np.nan
+    data[40:50] = np.nan
+    output_series = calculate_weighted_windows(pd.Series(data), window, statistic, full_output=False)
+    expected = reference_weighted_windows(data, np.array(_parse_window(window)), statistic)
+    assert np.array_equal(np.isnan(output_series.values), np.isnan(expected))
+    assert np.allclose(output_series.values, expected, equal_nan=True)
+    assert output_series.name == "{} over window".format(statistic)
+
+
+def test_order_statistics_long_window():
+    data_series = pd.Series(np.arange(20001, dtype=float))
+    window = "4" * 2001
+    output_series = calculate_weighted_windows(data_series, window, "median", full_output=False)
+    assert output_series.iloc[10000] == pytest.approx(0.5 * 10000)
+    assert output_series.iloc[0] == pytest.approx(0.5 * 500)
+    output_series = calculate_weighted_windows(data_series, window, "max", full_output=False)
+    assert output_series.iloc[10000] == pytest.approx(0.5 * 11000)
+    assert output_series.iloc[-1] == pytest.approx(0.5 * 20000)
+
+
+def test_long_series_and_window():
+    data_series = pd.Series(np.arange(20001, dtype=float))
+    output_series = calculate_weighted_windows(data_series, [1] * 201, "sum", full_output=False)
+    assert len(output_series) == 20001
+    assert output_series.iloc[10000] == pytest.approx(201 * 10000)
+    assert output_series.iloc[0] == pytest.approx(sum(range(101)))
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum", "median"])
+@pytest.mark.parametrize("engine, workers", [("auto", None), ("direct", None), ("fft", None), ("direct", 3)])
+def test_empty_data_series(statistic, engine, workers):
+    if engine == "fft" and statistic == "median":
+        return
+    data_series = pd.Series([], dtype=float)
+    output_series = calculate_weighted_windows(data_series, "4" * 41, statistic, full_output=False, engine=engine,
+                                               workers=workers)
+    assert len(output_series) == 0
+    window_array, df_orig_sliced, df_multiplied, output_series = calculate_weighted_windows(
+        data_series, "393x393x393", statistic, engine=engine, workers=workers)
+    assert len(output_series) == 0
+    assert df_orig_sliced.shape[1] == 0
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(pd.Series([1.0, 2.0]), "44", "mean")
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(pd.Series([1.0, 2.0]), "444", "mode")
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(pd.Series([1.0, 2.0]), "444", "q101")
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(pd.Series([1.0, 2.0]), "444", "median", engine="fft")
+    with pytest.raises(TypeError):
+        calculate_weighted_windows(pd.Series([1.0, 2.0]), 3, "mean")
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+@pytest.mark.parametrize("window", ["9xxxxx9xxxxx9", "4" * 41 + "x" + "7" * 41, [1, 2, "x", 0.5, 3]])
+def test_fft_engine_matches_direct(statistic, window):
+    rng = np.random.default_rng(2)
+    data = rng.normal(loc=10.0, size=3000)
+    data[rng.random(3000) < 0.1] = np.nan
+    data[1000:1100] = np.nan
+    data_series = pd.Series(data)
+    direct = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="direct")
+    fft = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="fft")
+    assert np.array_equal(np.isnan(direct.values), np.isnan(fft.values))
+    assert np.allclose(direct.values, fft.values, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("loc, scale", [(1e6, 1.0), (1e4, 0.1)])
+@pytest.mark.parametrize("window", ["9" * 41, "4" * 20 + "9" + "4" * 20, "1234567890" * 4 + "9"])
+def test_fft_std_with_offset_data(loc, scale, window):
+    rng = np.random.default_rng(3)
+    data = rng.normal(loc=loc, scale=scale, size=20000)
+    data[::97] = np.nan
+    data_series = pd.Series(data)
+    direct = calculate_weighted_windows(data_series, window, "std", full_output=False, engine="direct")
+    fft = calculate_weighted_windows(data_series, window, "std", full_output=False, engine="fft")
+    assert np.allclose(direct.values, fft.values, rtol=1e-8, atol=0)
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+@pytest.mark.parametrize("window", ["4" * 41, "4" * 20 + "x" + "4" * 20, "1234567890" * 4 + "9"])
+def test_fft_engine_with_infinite_data(statistic, window):
+    rng = np.random.default_rng(4)
+    data = rng.normal(size=2000)
+    data[::97] = np.nan
+    data[[500, 1500, 1510]] = [-np.inf, np.inf, np.inf]
+    data_series = pd.Series(data)
+    direct = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="direct")
+    # only the slices containing the infinite values are affected, as in the direct engine
+    assert np.isfinite(direct.values).sum() > 1800
+    for workers in [None, 3]:
+        fft = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="fft",
+                                         workers=workers)
+        assert np.array_equal(np.isinf(direct.values), np.isinf(fft.values))
+        assert np.allclose(direct.values, fft.values, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("statistic, window, engine", [("mean", "393x393x393", "direct"), ("std", "4" * 41, "fft"),
+                                                       ("sum", "9" + "x" * 99 + "9", "fft"),
+                                                       ("median", "4" * 51, "auto"), ("q90", "393", "direct")])
+def test_parallel_is_identical_to_serial(statistic, window, engine, monkeypatch):
+    from weighslide import weighslide as weighslide_module
+    # small FFT blocks, so that the data is split into many FFT blocks and chunks
+    monkeypatch.setattr(weighslide_module, "_FFT_BLOCK_MIN", 2 ** 9)
+    rng = np.random.default_rng(9)
+    data = rng.normal(loc=5.0, size=10007)
+    data[rng.random(10007) < 0.1] = np.nan
+    data_series = pd.Series(data)
+    serial = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine=engine)
+    for workers in [2, 3, 8]:
+        parallel = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine=engine,
+                                              workers=workers)
+        assert np.array_equal(serial.values, parallel.values, equal_nan=True)
+    data_df = pd.DataFrame({"a": data, "b": data[::-1]})
+    pd.testing.assert_frame_equal(calculate_weighted_windows_table(data_df, window, statistic, engine=engine),
+                                  calculate_weighted_windows_table(data_df, window, statistic, engine=engine,
+                                                                   workers=4), check_exact=True)
+
+
+@pytest.mark.parametrize("statistic, window, engine", [("mean", "393x393x393", "direct"), ("std", "494", "direct"),
+                                                       ("sum", "4" * 41, "fft"), ("std", "4" * 41, "fft"),
+                                                       ("median", "4" * 11, "direct"),
+                                                       ("q90", [1, 2, "x", 3, 2], "direct")])
+def test_float32_matches_float64(statistic, window, engine):
+    rng = np.random.default_rng(12)
+    data = rng.normal(loc=5.0, size=5000)
+    data[rng.random(5000) < 0.1] = np.nan
+    data_series = pd.Series(data)
+    full = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine=engine)
+    single = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine=engine,
+                                        dtype="float32")
+    assert full.dtype == np.float64 and single.dtype == np.float32
+    assert np.array_equal(np.isnan(full.values), np.isnan(single.values))
+    assert np.allclose(full.values, single.values, rtol=1e-5, atol=1e-5, equal_nan=True)
+    result = calculate_weighslide_result(data_series, window, statistic, engine=engine, dtype="float32")
+    assert result.multiplied_array.dtype == np.float32
+
+
+@pytest.mark.parametrize("engine, workers", [("direct", None), ("fft", None), ("direct", 3), ("fft", 3)])
+def test_out_array_is_filled_in_place(engine, workers, tmp_path):
+    rng = np.random.default_rng(13)
+    data_series = pd.Series(rng.normal(size=3000))
+    expected = calculate_weighted_windows(data_series, "4" * 41, "mean", full_output=False, engine=engine)
+    out = np.memmap(tmp_path / "out.dat", dtype=np.float64, mode="w+", shape=(3000,))
+    output_series = calculate_weighted_windows(data_series, "4" * 41, "mean", full_output=False, engine=engine,
+                                               workers=workers, out=out)
+    assert np.shares_memory(output_series.values, out)
+    assert np.array_equal(out, expected.values)
+    # the dtype of out is used for the calculation
+    out = np.empty((3000, 2), dtype=np.float32)
+    output_df = calculate_weighted_windows_table(pd.DataFrame({"a": data_series, "b": data_series}), "4" * 41,
+                                                 "mean", engine=engine, workers=workers, out=out)
+    assert np.shares_memory(output_df["a"].values, out)
+    assert np.allclose(out[:, 1], expected.values, rtol=1e-5, atol=1e-5)
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(data_series, "494", "mean", full_output=False, out=np.empty(2999))
+    with pytest.raises(ValueError):
+        calculate_weighted_windows(data_series, "494", "mean", full_output=False, dtype="int64")
+
+
+def test_compiled_window_is_cached_and_reused():
+    window = compile_window("393x393x393")
+    assert compile_window("393x393x393") is window and compile_window(window) is window
+    assert compile_window([1, 2, "x", 2, 1]) is compile_window([1, 2, "x", 2, 1])
+    assert window.window_length == 11 and window.extension_each_side == 5 and window.valid_count == 9
+    assert list(window.positions) == [0, 1, 2, 4, 5, 6, 8, 9, 10]
+    assert np.array_equal(window.count_kernel, ~np.isnan(window.window_array))
+    assert window.runs == [(0, 3), (4, 3), (8, 3)]
+    with pytest.raises(ValueError):
+        window.window_array[0] = 1.0
+    with pytest.raises(ValueError):
+        compile_window("44")
+    with pytest.raises(TypeError):
+        compile_window(494)
+    rng = np.random.default_rng(14)
+    data = rng.normal(size=500)
+    data[rng.random(500) < 0.1] = np.nan
+    data_series = pd.Series(data)
+    for statistic, engine in [("mean", "direct"), ("std", "fft"), ("median", "direct")]:
+        expected = calculate_weighted_windows(data_series, "393x393x393", statistic, full_output=False, engine=engine)
+        for compiled in [window, WeighslideWindow(window.window_array)]:
+            output_series = calculate_weighted_windows(data_series, compiled, statistic, full_output=False,
+                                                       engine=engine)
+            assert np.array_equal(output_series.values, expected.values, equal_nan=True)
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+@pytest.mark.parametrize("window", ["9xxxxx9xxxxx9", "393x393x393", [1, 2, "x", 0.5, 3], ["x", "x", "x"]])
+def test_numba_kernel_matches_direct(statistic, window):
+    rng = np.random.default_rng(15)
+    data = rng.normal(loc=10.0, size=(120, 2))
+    data[rng.random((120, 2)) < 0.2] = np.nan
+    data[40:60, 0] = np.nan
+    data_df = pd.DataFrame(data, columns=["a", "b"])
+    expected = calculate_weighted_windows_table(data_df, window, statistic, engine="direct")
+    # the kernel is plain python, so that it can be checked without numba
+    window_array = _parse_window(window)
+    valid = ~np.isnan(window_array)
+    output_array = np.empty(data.shape)
+    _weighted_windows_kernel(_pad_data(data, len(window_array)), np.flatnonzero(valid), window_array[valid],
+                             ["mean", "std", "sum"].index(statistic), output_array)
+    assert np.allclose(output_array, expected.values, rtol=1e-12, atol=1e-12, equal_nan=True)
+
+    pytest.importorskip("numba")
+    pd.testing.assert_frame_equal(calculate_weighted_windows_table(data_df, window, statistic, engine="numba"),
+                                  expected, rtol=1e-12, atol=1e-12)
+    data_series = pd.Series(rng.normal(size=5000))
+    data_series[rng.random(5000) < 0.1] = np.nan
+    direct = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="direct")
+    numba = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="numba")
+    assert np.allclose(numba.values, direct.values, rtol=1e-12, atol=1e-12, equal_nan=True)
+    parallel = calculate_weighted_windows(data_series, window, statistic, full_output=False, engine="numba",
+                                          workers=3)
+    assert np.array_equal(parallel.values, numba.values, equal_nan=True)
+
+
+def test_numba_engine_falls_back_to_direct(monkeypatch):
+    from weighslide import weighslide as weighslide_module
+    # numba is used for long series only
+    monkeypatch.setattr(weighslide_module, "_numba_is_installed", lambda: True)
+    assert _choose_engine(1000, 11) == "direct"
+    assert _choose_engine(10 ** 7, 11) == "numba"
+    # numba is not installed
+    monkeypatch.setattr(weighslide_module, "_numba_is_installed", lambda: False)
+    monkeypatch.setattr(weighslide_module, "_get_numba_kernel", lambda: None)
+    assert _choose_engine(10 ** 7, 11) == "direct"
+    assert _choose_engine(1000, 101) == "fft"
+    data_series = pd.Series(np.arange(20, dtype=float))
+    output_series = calculate_weighted_windows(data_series, "494", "mean", full_output=False)
+    assert np.isclose(output_series[5], (0.5 * 4 + 5 + 0.5 * 6) / 3)
+    with pytest.raises(ImportError):
+        calculate_weighted_windows(data_series, "494", "mean", full_output=False, engine="numba")
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum", "median"])
+def test_x_window_is_independent_of_chunks(statistic):
+    # the chunks of 3 workers and the single-value stream updates are much shorter than the window
+    window = "4" * 16 + "x" + "4" * 16
+    for seed in range(5):
+        data = np.random.default_rng(seed).normal(size=100)
+        serial = calculate_weighted_windows(pd.Series(data), window, statistic, full_output=False, engine="direct")
+        parallel = calculate_weighted_windows(pd.Series(data), window, statistic, full_output=False,
+                                              engine="direct", workers=3)
+        assert np.array_equal(parallel.values, serial.values, equal_nan=True)
+        stream = WeighslideStream(window, statistic, engine="direct")
+        output_array = np.concatenate([stream.update(value) for value in data] + [stream.flush()])
+        assert np.array_equal(output_array, serial.values, equal_nan=True)
+        table = calculate_weighted_windows_table(pd.DataFrame({"a": data, "b": data[::-1]}), window, statistic,
+                                                 engine="direct", workers=3)
+        assert np.array_equal(table["a"].values, serial.values, equal_nan=True)
+
+
+def test_result_slices_are_lazy():
+    data_series = pd.Series([0, 0, 0, 1, 1, 2, 3, 5, 8, 13, 21], dtype=float)
+    result = calculate_weighslide_result(data_series, [2, "x", 2], "sum")
+    assert result._df_orig_sliced is None and result._multiplied_array is None
+    assert result.sliced_array.shape == (11, 3)
+    assert np.isnan(result.sliced_array[0, 0])
+    assert np.allclose(np.nansum(result.multiplied_array, axis=1), result.output_series.values)
+    window_array, df_orig_sliced, df_multiplied, output_series = calculate_weighted_windows(data_series, [2, "x", 2],
+                                                                                            "sum")
+    pd.testing.assert_frame_equal(result.df_orig_sliced, df_orig_sliced)
+    pd.testing.assert_frame_equal(result.df_multiplied, df_multiplied)
+    assert df_orig_sliced.loc[-1, "window 0"] == "nodata"
+    assert df_multiplied.loc[0, "window 0"] == ""
+
+
+@pytest.mark.parametrize("engine", ["direct", "fft"])
+def test_table_matches_single_columns(engine):
+    rng = np.random.default_rng(4)
+    data_df = pd.DataFrame(rng.normal(size=(500, 4)), columns=["a", "b", "c", "d"])
+    data_df.iloc[rng.random(500) < 0.1, 1] = np.nan
+    data_df["label"] = "text"
+    output_df = calculate_weighted_windows_table(data_df, "494x494x494", "std", engine=engine)
+    assert list(output_df.columns) == ["a", "b", "c", "d"]
+    for column in output_df.columns:
+        output_series = calculate_weighted_windows(data_df[column].copy(), "494x494x494", "std", full_output=False,
+                                                   engine=engine)
+        assert np.allclose(output_df[column].values, output_series.values, equal_nan=True, rtol=1e-12, atol=1e-12)
+    output_df = calculate_weighted_windows_table(data_df, [1, 1, 1], "sum", columns=["b", "a"])
+    assert list(output_df.columns) == ["b", "a"]
+    for statistic, window in [("max", "4x4"), ("median", "44444")]:
+        output_df = calculate_weighted_windows_table(data_df, window, statistic)
+        for column in output_df.columns:
+            output_series = calculate_weighted_windows(data_df[column].copy(), window, statistic, full_output=False)
+            assert np.allclose(output_df[column].values, output_series.values, equal_nan=True)
+
+
+@pytest.mark.parametrize("statistic, engine", [("mean", "direct"), ("std", "fft"), ("sum", "auto"), ("q75", "auto")])
+@pytest.mark.parametrize("window", ["494", "9xxxxx9xxxxx9", "4" * 41])
+def test_grouped_matches_single_series(statistic, engine, window):
+    rng = np.random.default_rng(7)
+    lengths = [1, 30, 5, 200, 12, 64]
+    data_df = pd.DataFrame({"protein": np.repeat(["P{}".format(n) for n in range(len(lengths))], lengths),
+                            "value": rng.normal(size=sum(lengths))})
+    data_df.loc[rng.random(len(data_df)) < 0.1, "value"] = np.nan
+    # shuffle the rows, so that the rows of each series are not adjacent
+    data_df = data_df.sample(frac=1.0, random_state=1)
+    output_series = calculate_weighted_windows_grouped(data_df, window, statistic, "protein", engine=engine)
+    assert output_series.index.equals(data_df.index)
+    for protein, protein_df in data_df.groupby("protein", sort=False):
+        expected = calculate_weighted_windows(protein_df["value"].copy(), window, statistic, full_output=False,
+                                              engine=engine)
+        if engine == "direct":
+            assert np.array_equal(output_series[protein_df.index].values, expected.values, equal_nan=True)
+        else:
+            assert np.allclose(output_series[protein_df.index].values, expected.values, equal_nan=True, rtol=1e-9,
+                               atol=1e-9)
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum", "q75"])
+def test_bank_matches_single_windows(statistic):
+    rng = np.random.default_rng(5)
+    data = rng.normal(loc=3.0, size=400)
+    data[rng.random(400) < 0.1] = np.nan
+    data_series = pd.Series(data)
+    windows = ["393x393x393", "4x4", [1, 0, "x", 0.5, 2], "9", "9xxxxx9xxxxx9", list(np.arange(1, 18) / 10)]
+    output_df = calculate_weighted_windows_bank(data_series, windows, statistic)
+    assert output_df.shape == (400, 6)
+    for window, column in zip(windows, output_df.columns):
+        output_series = calculate_weighted_windows(data_series.copy(), window, statistic, full_output=False,
+                                                   engine="direct")
+        assert np.allclose(output_df[column].values, output_series.values, equal_nan=True, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+def test_bank_with_infinite_data(statistic):
+    data = np.random.default_rng(8).normal(size=200)
+    data[[50, 120]] = [np.inf, -np.inf]
+    data_series = pd.Series(data)
+    windows = ["494", "4" * 21]
+    output_df = calculate_weighted_windows_bank(data_series, windows, statistic)
+    for window, column in zip(windows, output_df.columns):
+        output_series = calculate_weighted_windows(data_series.copy(), window, statistic, full_output=False,
+                                                   engine="direct")
+        assert np.array_equal(output_df[column].values, output_series.values, equal_nan=True)
+
+
+@pytest.mark.parametrize("loc, scale", [(1e5, 1e-2), (1e6, 1.0)])
+def test_bank_std_with_offset_data(loc, scale):
+    rng = np.random.default_rng(6)
+    data = rng.normal(loc=loc, scale=scale, size=2000)
+    data[::37] = np.nan
+    data_series = pd.Series(data)
+    windows = ["9" * 7, "444" + "9" + "444", "1234567890" * 2 + "9", [0.5, 1, "x", 2, 1.5]]
+    output_df = calculate_weighted_windows_bank(data_series, windows, "std")
+    for window, column in zip(windows, output_df.columns):
+        output_series = calculate_weighted_windows(data_series.copy(), window, "std", full_output=False,
+                                                   engine="direct")
+        assert np.allclose(output_df[column].values, output_series.values, equal_nan=True, rtol=1e-8, atol=0)
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    from weighslide import weighslide as weighslide_module
+    data_series = pd.Series(np.random.random_sample(500))
+    cache = ResultCache(tmp_path / "cache")
+    first = calculate_weighslide_result(data_series, "494", "mean", engine="direct", cache=cache).output_series
+    assert len(list((tmp_path / "cache").glob("*.npy"))) == 1
+
+    # a cache hit does not recalculate the output
+    def fail(*args, **kwargs):
+        raise AssertionError("output was recalculated")
+    monkeypatch.setattr(weighslide_module, "_calculate_weighted_windows_direct", fail)
+    second = calculate_weighslide_result(data_series, "494", "mean", engine="direct",
+                                         cache=tmp_path / "cache").output_series
+    pd.testing.assert_series_equal(first, second)
+    # any change to the data, window or statistic is a cache miss
+    with pytest.raises(AssertionError):
+        calculate_weighslide_result(data_series, "494", "sum", engine="direct", cache=cache)
+    data_series[3] = 0.5
+    with pytest.raises(AssertionError):
+        calculate_weighslide_result(data_series, "494", "mean", engine="direct", cache=cache)
+
+
+def test_result_cache_eviction(tmp_path):
+    cache = ResultCache(tmp_path, max_bytes=3000)
+    for key in ["a", "b", "c"]:
+        cache.put(key, np.zeros(100))
+    # "a" is used again, so "b" is the least recently used file
+    assert cache.get("a") is not None
+    cache.put("d", np.zeros(100))
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in ["a", "c", "d"])
+
+
+@pytest.mark.parametrize("statistic, window, engine", [("mean", "494", "direct"), ("std", "9xxxxx9xxxxx9", "direct"),
+                                                       ("median", [1, 2, "x", 0.5, 3], "direct"),
+                                                       ("max", "4" * 41, "auto"), ("sum", "4" * 41, "fft")])
+def test_stream_matches_batch(statistic, window, engine):
+    rng = np.random.default_rng(6)
+    data = rng.normal(size=300)
+    data[rng.random(300) < 0.1] = np.nan
+    expected = calculate_weighted_windows(pd.Series(data), window, statistic, full_output=False, engine=engine).values
+
+    stream = WeighslideStream(window, statistic, engine=engine)
+    # single values, and batches of different lengths, including batches longer than the window
+    outputs = [stream.update(value) for value in data[:20]]
+    outputs += [stream.update(data[start:end]) for start, end in [(20, 21), (21, 24), (24, 100), (100, 300)]]
+    assert stream.positions_received == 300
+    outputs.append(stream.flush())
+    output_array = np.concatenate(outputs)
+    if engine == "direct":
+        assert np.array_equal(output_array, expected, equal_nan=True)
+    else:
+        assert np.allclose(output_array, expected, equal_nan=True, rtol=1e-9, atol=1e-9)
+    # after a flush, the stream starts a new data series
+    assert stream.positions_emitted == 0
+    assert len(stream.update(data[:3])) + len(stream.flush()) == 3
+
+
+def test_stream_output_is_delayed_by_half_window():
+    stream = WeighslideStream("44444", "sum")
+    assert len(stream.update(1.0)) == 0
+    assert len(stream.update([1.0, 1.0])) == 1
+    assert stream.update(1.0) == pytest.approx([0.5 * 4])
+    assert stream.flush() == pytest.approx([0.5 * 4, 0.5 * 3])
+    with pytest.raises(ValueError):
+        stream.update([[1.0, 2.0]])
+
+
+def reference_weighted_windows_2d(data, window_array, statistic):
+    """ Slow reference implementation for 2D windows, applying pandas statistics to one slice at a time."""
+    extension_rows, extension_cols = [int((length - 1) / 2) for length in window_array.shape]
+    padded = np.full((data.shape[0] + 2 * extension_rows, data.shape[1] + 2 * extension_cols), np.nan)
+    padded[extension_rows:extension_rows + data.shape[0], extension_cols:extension_cols + data.shape[1]] = data
+    output = np.empty(data.shape)
+    for i in range(data.shape[0]):
+        for j in range(data.shape[1]):
+            win_multiplied = padded[i:i + window_array.shape[0], j:j + window_array.shape[1]] * window_array
+            output[i, j] = getattr(pd.Series(win_multiplied.ravel()), statistic)()
+    return output
+
+
+@pytest.mark.parametrize("statistic", ["mean", "std", "sum"])
+@pytest.mark.parametrize("engine", ["direct", "fft"])
+@pytest.mark.parametrize("window", ["494\n9x9\n494\n4x4\n494", [[1, "x", 2]], "\n".join(["4" * 9] * 7)])
+def test_2d_matches_reference(statistic, engine, window):
+    rng = np.random.default_rng(8)
+    data = rng.normal(loc=2.0, size=(30, 47))
+    data[rng.random(data.shape) < 0.1] = np.nan
+    data[10:20, 5:15] = np.nan
+    data_df = pd.DataFrame(data, index=range(100, 130))
+    output_df = calculate_weighted_windows_2d(data_df, window, statistic, engine=engine)
+    assert output_df.index.equals(data_df.index)
+    expected = reference_weighted_windows_2d(data, _parse_window_2d(window), statistic)
+    assert np.allclose(output_df.values, expected, equal_nan=True, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("loc", [1e3, 1e5])
+@pytest.mark.parametrize("window", ["\n".join(["9999999"] * 7), "494\n9x9\n494",
+                                    "\n".join(["4444444"] * 2 + ["4449444", "4499944", "4449444"] + ["4444444"] * 2)])
+def test_2d_fft_std_with_offset_data(loc, window):
+    rng = np.random.default_rng(7)
+    data = rng.normal(loc=loc, scale=0.01, size=(120, 100))
+    data[rng.random(data.shape) < 0.05] = np.nan
+    direct = calculate_weighted_windows_2d(data, window, "std", engine="direct")
+    fft = calculate_weighted_windows_2d(data, window, "std", engine="fft")
+    # slices with a small std (only the values of one weight) have a larger relative error
+    assert np.allclose(direct.values, fft.values, equal_nan=True, rtol=1e-6, atol=0)
+
+def test_2d_invalid_window():
+    with pytest.raises(ValueError):
+        calculate_weighted_windows_2d(np.zeros((5, 5)), "494\n494", "mean")
+    with pytest.raises(ValueError):
+        calculate_weighted_windows_2d(np.zeros((5, 5)), "494\n49494\n494", "mean")
+    with pytest.raises(ValueError):
+        calculate_weighted_windows_2d(np.zeros((5, 5)), "494", "median")
@@ -3,9 +3,10 @@ from shutil import rmtree
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+import pytest
 
 from pathlib import Path
-from weighslide import run_weighslide
+from weighslide import run_weighslide, calculate_weighted_windows
 
 
 def test_function():
@@ -33,5 +34,198 @@ def test_function():
     assert (weighslide_output_dir / "wavetest9xxxxx9xxxxx9xxxxx9x_mean.csv").is_file()
     assert (weighslide_output_dir / "wavetest9xxxxx9xxxxx9xxxxx9x_sliced.csv").is_file()
 
+    # run weighslide without saving the slices
+    run_weighslide(data_csv, window, "sum", name="nodiag", column="noisy wave", overwrite=True, diagnostics=False)
+    assert (weighslide_output_dir / "nodiag9xxxxx9xxxxx9xxxxx9x_sum.csv").is_file()
+    assert not (weighslide_output_dir / "nodiag9xxxxx9xxxxx9xxxxx9x_sliced.csv").is_file()
+
     if temp_output_dir.is_dir():
         rmtree(temp_output_dir)
+
+
+def test_chunked_csv():
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_chunked"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(3)
+    df = pd.DataFrame({"a": rng.random(1000), "b": rng.normal(size=1000)})
+    df.loc[rng.random(1000) < 0.1, "b"] = np.nan
+    data_csv = temp_output_dir / "trace.csv"
+    df.to_csv(data_csv)
+    weighslide_output_dir = temp_output_dir / "weighslide_output"
+
+    for window in ["494x494x494", "9" * 51]:
+        run_weighslide(data_csv, window, "std", name="full", column="b", overwrite=True, diagnostics=False)
+        run_weighslide(data_csv, window, "std", name="chunked", column="b", overwrite=True, chunksize=37)
+        full = pd.read_csv(weighslide_output_dir / "full{}_std.csv".format(window[:20]), index_col=0)
+        chunked = pd.read_csv(weighslide_output_dir / "chunked{}_std.csv".format(window[:20]), index_col=0)
+        pd.testing.assert_frame_equal(full, chunked, check_exact=False, rtol=1e-9)
+
+    rmtree(temp_output_dir)
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather", "npy"])
+def test_binary_input_and_output(output_format):
+    if output_format != "npy":
+        pytest.importorskip("pyarrow")
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_{}".format(output_format)
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    data = np.random.random_sample((200, 3))
+    if output_format == "npy":
+        infile = temp_output_dir / "trace.npy"
+        np.save(infile, data)
+        column = 1
+    else:
+        infile = temp_output_dir / "trace.{}".format(output_format)
+        df = pd.DataFrame(data, columns=["a", "b", "c"])
+        df.to_parquet(infile) if output_format == "parquet" else df.to_feather(infile)
+        column = "b"
+
+    run_weighslide(infile, "494", "mean", name="bin", column=column, overwrite=True, output_format=output_format,
+                   excel=False)
+    weighslide_output_dir = temp_output_dir / "weighslide_output"
+    assert not (weighslide_output_dir / "bin494.xlsx").is_file()
+    assert not (weighslide_output_dir / "bin494_mean.csv").is_file()
+    expected = calculate_weighted_windows(pd.Series(data[:, 1]), "494", "mean", full_output=False)
+    if output_format == "npy":
+        output = np.load(weighslide_output_dir / "bin494_mean.npy")
+        sliced = np.load(weighslide_output_dir / "bin494_sliced.npy")
+    else:
+        read = pd.read_parquet if output_format == "parquet" else pd.read_feather
+        output = read(weighslide_output_dir / "bin494_mean.{}".format(output_format))["mean over window"].values
+        sliced = read(weighslide_output_dir / "bin494_sliced.{}".format(output_format))[["-1", "0", "1"]].values
+    assert np.allclose(output, expected.values)
+    assert sliced.shape == (200, 3)
+    assert np.allclose(sliced[1:, 0], data[:-1, 1])
+
+    rmtree(temp_output_dir)
+
+
+def test_metrics_and_progress(capsys):
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_metrics"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    data_csv = temp_output_dir / "data.csv"
+    pd.DataFrame({"value": np.random.random_sample(1000)}).to_csv(data_csv, index=False)
+
+    hooked = []
+    reported = []
+    metrics = run_weighslide(data_csv, "494", "mean", overwrite=True, diagnostics=False, verbose=False,
+                             progress=lambda done, total: reported.append((done, total)),
+                             hook=lambda stage, seconds, nbytes: hooked.append(stage))
+    assert capsys.readouterr().out == ""
+    assert reported[-1] == (1000, 1000)
+    stages = metrics.to_dataframe()
+    assert stages.stage.tolist() == ["read", "window", "compute", "csv_write", "excel_write", "plot"]
+    assert hooked == stages.stage.tolist()
+    assert (stages.bytes > 0).all()
+    assert stages.set_index("stage").loc["read", "bytes"] == data_csv.stat().st_size
+
+    rmtree(temp_output_dir)
+
+
+def test_plot_downsampling_and_opt_out():
+    from weighslide.weighslide import _get_minmax_indices
+    y_values = np.sin(np.linspace(0, 50, 100001))
+    y_values[500] = 10.0
+    y_values[90000] = -10.0
+    y_values[2000:3000] = np.nan
+    indices = _get_minmax_indices(y_values, 1000)
+    assert len(indices) <= 2000
+    assert np.all(np.diff(indices) > 0)
+    assert 500 in indices and 90000 in indices
+    assert np.allclose(_get_minmax_indices(y_values[:100], 1000), np.arange(100))
+
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_plot"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    data_csv = temp_output_dir / "data.csv"
+    pd.DataFrame({"value": y_values}).to_csv(data_csv, index=False)
+    run_weighslide(data_csv, "494", "mean", name="long", overwrite=True, diagnostics=False, excel=False)
+    assert (temp_output_dir / "weighslide_output" / "long494.png").is_file()
+    metrics = run_weighslide(data_csv, "494", "mean", name="noplot", overwrite=True, diagnostics=False, excel=False,
+                             plot=False)
+    assert not (temp_output_dir / "weighslide_output" / "noplot494.png").is_file()
+    assert "plot" not in metrics.to_dataframe().stage.tolist()
+
+    rmtree(temp_output_dir)
+
+
+def test_grouped_input_file():
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_grouped"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    data_csv = temp_output_dir / "data.csv"
+    df = pd.DataFrame({"trace": ["a"] * 5 + ["b"] * 3, "value": [1.0, 2.0, 3.0, 4.0, 5.0, 10.0, 20.0, 30.0]})
+    df.to_csv(data_csv, index=False)
+    run_weighslide(data_csv, [1, 1, 1], "sum", column="value", group_column="trace", name="grouped", excel=False,
+                   overwrite=True, verbose=False)
+    output_df = pd.read_csv(temp_output_dir / "weighslide_output" / "grouped_sum.csv", index_col=0)
+    assert list(output_df.trace) == list(df.trace)
+    assert list(output_df["sum over window"]) == [3.0, 6.0, 9.0, 12.0, 9.0, 30.0, 60.0, 50.0]
+    assert not (temp_output_dir / "weighslide_output" / "grouped.png").is_file()
+
+    rmtree(temp_output_dir)
+
+
+def test_concurrent_writers_are_atomic(monkeypatch):
+    from weighslide import weighslide as weighslide_module
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_writers"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    weighslide_output_dir = temp_output_dir / "weighslide_output"
+    data_csv = temp_output_dir / "data.csv"
+    pd.DataFrame({"value": np.random.random_sample(60)}).to_csv(data_csv, index=False)
+
+    for write_workers in [None, 1]:
+        metrics = run_weighslide(data_csv, "494", "sum", name="w", overwrite=True, verbose=False,
+                                 write_workers=write_workers)
+        assert metrics.to_dataframe().stage.tolist() == ["read", "window", "compute", "csv_write", "excel_write",
+                                                         "plot"]
+    output_series = pd.read_csv(weighslide_output_dir / "w494_sum.csv", index_col=0).iloc[:, 0]
+    assert len(output_series) == 60
+
+    # a failed writer leaves neither a partial file nor a temporary file, and the error is raised after the other
+    # files are written
+    def fail(data_series, output_series, window, out_png, **kwargs):
+        with open(out_png, "w") as f:
+            f.write("incomplete")
+        raise RuntimeError("plot failed")
+    monkeypatch.setattr(weighslide_module, "_plot_output", fail)
+    (weighslide_output_dir / "w494.png").unlink()
+    with pytest.raises(RuntimeError):
+        run_weighslide(data_csv, "494", "mean", name="w", overwrite=True, verbose=False)
+    assert not (weighslide_output_dir / "w494.png").exists()
+    assert (weighslide_output_dir / "w494_mean.csv").is_file()
+    assert not any(".tmp" in path.name for path in weighslide_output_dir.iterdir())
+
+    rmtree(temp_output_dir)
+
+
+def test_large_slice_tables_are_skipped(monkeypatch):
+    from weighslide import weighslide as weighslide_module
+    # the limit of earlier versions (10000 positions, windows of up to 101 positions) is kept
+    assert not weighslide_module._band_is_too_large(10000, 101)
+    monkeypatch.setattr(weighslide_module, "_BAND_MAX_CELLS", 1000)
+    temp_output_dir = Path(__file__).parents[1] / "tests/temp_output_band"
+    temp_output_dir.mkdir(parents=True, exist_ok=True)
+    weighslide_output_dir = temp_output_dir / "weighslide_output"
+    data_csv = temp_output_dir / "data.csv"
+    pd.DataFrame({"value": np.random.random_sample(60)}).to_csv(data_csv, index=False)
+
+    # the tables of slices are skipped with a warning, and the other outputs are saved
+    with pytest.warns(UserWarning, match="slices"):
+        run_weighslide(data_csv, "494", "mean", name="b", overwrite=True, verbose=False, plot=False)
+    assert (weighslide_output_dir / "b494_mean.csv").is_file()
+    assert (weighslide_output_dir / "b494.xlsx").is_file()
+    assert not (weighslide_output_dir / "b494_sliced.csv").exists()
+    assert pd.ExcelFile(weighslide_output_dir / "b494.xlsx").sheet_names == ["window_mean"]
+
+    # binary formats save the slices with one slice per row
+    with pytest.warns(UserWarning, match="slices"):
+        run_weighslide(data_csv, "494", "mean", name="b", overwrite=True, verbose=False, plot=False,
+                       output_format="npy")
+    assert (weighslide_output_dir / "b494_mean.npy").is_file()
+    assert len(list(weighslide_output_dir.glob("b494_*.npy"))) == 3
+
+    with pytest.raises(ValueError, match="full_output=False"):
+        calculate_weighted_windows(pd.Series(np.arange(60.0)), "494", "mean")
+    output_series = calculate_weighted_windows(pd.Series(np.arange(60.0)), "494", "mean", full_output=False)
+    assert len(output_series) == 60
+
+    rmtree(temp_output_dir)
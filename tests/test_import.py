@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+weighslide_dir = Path(__file__).parents[1]
+
+
+def cold_import_seconds(statement):
+    """ Import time of a statement in a new python interpreter, as the fastest of three runs."""
+    code = "import time; start = time.perf_counter(); {}; print(time.perf_counter() - start)".format(statement)
+    timings = []
+    for _ in range(3):
+        output = subprocess.run([sys.executable, "-c", code], cwd=weighslide_dir, capture_output=True, text=True,
+                                check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def test_import_does_not_load_matplotlib():
+    code = "import sys, weighslide; print('matplotlib' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=weighslide_dir, capture_output=True, text=True,
+                            check=True).stdout
+    assert output.strip() == "False"
+
+
+def test_cold_import_time():
+    # weighslide should add little to the import time of its required dependencies
+    dependencies_seconds = cold_import_seconds("import numpy, pandas")
+    weighslide_seconds = cold_import_seconds("import weighslide")
+    assert weighslide_seconds - dependencies_seconds < 0.25
+
+
+def test_command_line_raw_data():
+    output = subprocess.run([sys.executable, "-m", "weighslide.weighslide", "[1,1,'x',1,1]", "mean", "-r",
+                             "[1,1,2,3,5,8,13,21,34]"], cwd=weighslide_dir, capture_output=True, text=True,
+                            check=True).stdout
+    assert "17.000000" in output
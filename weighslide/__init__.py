@@ -1,2 +1,14 @@
 from weighslide.weighslide import run_weighslide
 from weighslide.weighslide import calculate_weighted_windows
+from weighslide.weighslide import calculate_weighted_windows_table
+from weighslide.weighslide import calculate_weighted_windows_grouped
+from weighslide.weighslide import calculate_weighted_windows_bank
+from weighslide.weighslide import calculate_weighted_windows_2d
+from weighslide.weighslide import calculate_weighslide_result
+from weighslide.weighslide import WeighslideResult
+from weighslide.weighslide import ResultCache
+from weighslide.weighslide import WeighslideMetrics
+from weighslide.weighslide import WeighslideStream
+from weighslide.weighslide import WeighslideWindow
+from weighslide.weighslide import compile_window
+from weighslide.batch import run_weighslide_batch
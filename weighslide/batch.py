@@ -0,0 +1,275 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Union
+
+import pandas as pd
+import os
+import argparse
+import ast
+import glob
+import hashlib
+import time
+import traceback
+
+import numpy as np
+
+from weighslide.weighslide import run_weighslide, compile_window, _get_out_basename, _get_statistic_argument
+
+# extensions of input files used when the input is a directory
+_INPUT_EXTENSIONS = [".csv", ".xls", ".xlsx", ".parquet", ".feather", ".npy"]
+# keyword arguments of run_weighslide that do not change the output files
+_SETTINGS_IGNORED = ["name", "verbose", "progress", "hook", "workers", "write_workers", "cache", "overwrite",
+                     "showfig"]
+
+
+def run_weighslide_batch(inputs: Union[list, Path, str], window: Union[list, str], statistic: str,
+                         processes: int = None, skip_up_to_date: bool = True, report: Union[Path, str] = None,
+                         **kwargs):
+    """ Runs weighslide for many input files, using a pool of processes.
+
+    Each input file is analysed with run_weighslide, and the output files are saved in a subfolder of the input file
+    directory, as for a single file. The full filename (e.g. "sample_replicate_0001.csv") is used as the name of the
+    output files, so that each input file has its own outputs. Input files whose outputs would overwrite each other
+    (e.g. the same file listed twice) fail. Errors in one file are recorded in the summary, and do not stop the batch.
+
+    Parameters
+    ----------
+    inputs : list, Path or string
+        The input files. Can be a list of paths, a directory (all csv, excel, parquet, feather and npy files in the
+        directory are used), a glob pattern (e.g. "D:/data/*/sample_*.csv"), or a manifest file with a .txt
+        extension, containing one path per line. Relative paths in a manifest are relative to the manifest location.
+    window : list or string
+        The user-defined window. See run_weighslide.
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. See calculate_weighted_windows.
+    processes : int
+        Number of worker processes. The default (None) uses one process per CPU. If 1, the files are analysed in
+        the current process.
+    skip_up_to_date : boolean
+        If True, input files are skipped if the output statistic file is newer than the input file, and was created
+        with the same settings. The settings (window, statistic and keyword arguments) are saved as a hash in a
+        ".settings" file next to the output statistic file. Outputs that are older than the input file, or were created
+        with other settings, are overwritten.
+    report : Path or string
+        If given, the summary is also saved as a csv file.
+
+    Keyword arguments (optional):
+    ----------
+    Any keyword argument of run_weighslide (e.g. column, engine, diagnostics, csv_kwargs), except "name",
+    which is taken from each filename. If verbose is False, the start and end of the batch are not printed.
+
+    Returns
+    -------
+    summary_df : pd.DataFrame
+        One row for each input file, with the columns "infile", "status" ("finished", "skipped" or "failed"),
+        "seconds" and "error". The error contains the traceback of failed files.
+    """
+    if "name" in kwargs.keys():
+        raise ValueError('The "name" variable cannot be used in a batch, as each input file requires a unique name.')
+
+    # determine the user variable "verbose". The printed output of each file is controlled by _run_batch_item.
+    verbose = kwargs["verbose"] if "verbose" in kwargs.keys() else True
+
+    infiles = find_batch_inputs(inputs)
+    if verbose:
+        print("Starting weighslide batch analysis of {} files.".format(len(infiles)))
+
+    # input files with the same output files would overwrite each other, and are not analysed
+    out_statistics = [os.path.normcase(os.path.abspath(_get_out_statistic(infile, window, statistic, kwargs)))
+                      for infile in infiles]
+    out_statistic_counts = pd.Series(out_statistics).value_counts()
+
+    rows = []
+    items = []
+    for infile, out_statistic in zip(infiles, out_statistics):
+        if out_statistic_counts[out_statistic] > 1:
+            error = "The output file {} is shared with {} other input files.".format(
+                out_statistic, out_statistic_counts[out_statistic] - 1)
+            rows.append({"infile": str(infile), "status": "failed", "seconds": 0.0, "error": error})
+        elif skip_up_to_date and _output_is_up_to_date(infile, window, statistic, kwargs):
+            rows.append({"infile": str(infile), "status": "skipped", "seconds": 0.0, "error": ""})
+        else:
+            items.append(infile)
+
+    if processes == 1:
+        for infile in items:
+            rows.append(_run_batch_item(infile, window, statistic, kwargs))
+    elif len(items) > 0:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            futures = {executor.submit(_run_batch_item, infile, window, statistic, kwargs): infile for infile in items}
+            for future in as_completed(futures):
+                # errors outside run_weighslide (e.g. arguments that cannot be sent to the worker processes, or a
+                # worker process that was terminated) are recorded for the file, and do not stop the batch
+                try:
+                    rows.append(future.result())
+                except Exception:
+                    rows.append({"infile": str(futures[future]), "status": "failed", "seconds": 0.0,
+                                 "error": traceback.format_exc()})
+
+    summary_df = pd.DataFrame(rows, columns=["infile", "status", "seconds", "error"])
+    # order the summary as the input files
+    summary_df["order"] = summary_df.infile.map({str(infile): n for n, infile in enumerate(infiles)})
+    summary_df = summary_df.sort_values("order").drop(columns="order").reset_index(drop=True)
+
+    if report is not None:
+        summary_df.to_csv(report, index=False)
+
+    counts = summary_df.status.value_counts()
+    if verbose:
+        print("Weighslide batch analysis is finished. {} finished, {} skipped, {} failed.".format(
+        counts.get("finished", 0), counts.get("skipped", 0), counts.get("failed", 0)))
+    return summary_df
+
+
+def find_batch_inputs(inputs):
+    """ Get the list of input files for a batch.
+
+    Parameters
+    ----------
+    inputs : list, Path or string
+        List of paths, directory, glob pattern or manifest file. See run_weighslide_batch.
+
+    Returns
+    -------
+    infiles : list
+        List of Path objects.
+    """
+    if type(inputs) == list:
+        return [Path(infile) for infile in inputs]
+
+    inputs = Path(inputs)
+    if inputs.is_dir():
+        # all input files in the directory
+        infiles = [path for path in inputs.iterdir() if path.suffix in _INPUT_EXTENSIONS]
+    elif inputs.is_file() and inputs.suffix == ".txt":
+        # manifest with one path per line. Empty lines and lines starting with # are ignored.
+        infiles = []
+        for line in inputs.read_text().splitlines():
+            line = line.strip()
+            if line == "" or line.startswith("#"):
+                continue
+            path = Path(line)
+            infiles.append(path if path.is_absolute() else inputs.parent / path)
+        return infiles
+    else:
+        infiles = [Path(path) for path in glob.glob(str(inputs))]
+
+    if len(infiles) == 0:
+        raise FileNotFoundError("No input files found for '{}'.".format(inputs))
+    return sorted(infiles)
+
+
+def _get_out_statistic(infile, window, statistic, kwargs):
+    """ Get the path of the output statistic file of an input file, as created by run_weighslide."""
+    output_format = kwargs["output_format"] if "output_format" in kwargs.keys() else "csv"
+    out_basename = _get_out_basename(infile, window, name=os.path.basename(infile))[2]
+    return out_basename + "_{}".format(statistic) + "." + output_format
+
+
+def _get_settings_hash(window, statistic, kwargs):
+    """ Get a hash of the settings that determine the output files of a batch item.
+
+    The output filenames do not identify the settings (e.g. list windows, or keyword arguments such as column or
+    engine), and the hash is used to detect outputs that were created with other settings.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(np.ascontiguousarray(compile_window(window).window_array).tobytes())
+    settings = sorted((key, value) for key, value in kwargs.items() if key not in _SETTINGS_IGNORED)
+    hasher.update("{}|{}".format(statistic, settings).encode())
+    return hasher.hexdigest()
+
+
+def _output_is_up_to_date(infile, window, statistic, kwargs):
+    """ Check if the output statistic file of an input file is newer than the input file, with the same settings."""
+    out_statistic = _get_out_statistic(infile, window, statistic, kwargs)
+    settings_file = out_statistic + ".settings"
+    if not os.path.isfile(out_statistic) or not os.path.isfile(settings_file) or not os.path.isfile(infile):
+        return False
+    if os.path.getmtime(out_statistic) < os.path.getmtime(infile):
+        return False
+    with open(settings_file) as f:
+        return f.read().strip() == _get_settings_hash(window, statistic, kwargs)
+
+
+def _run_batch_item(infile, window, statistic, kwargs):
+    """ Run weighslide for a single file of a batch, and return a row of the summary.
+
+    Any error is caught and returned, so that one file cannot stop the batch.
+    The printed output of run_weighslide is switched off, unless verbose=True is given.
+    """
+    start = time.perf_counter()
+    kwargs = dict({"verbose": False}, **kwargs)
+    kwargs["overwrite"] = True
+    # the full filename gives each input file its own output files
+    kwargs["name"] = os.path.basename(infile)
+    try:
+        run_weighslide(infile, window, statistic, **kwargs)
+        # save the settings of the outputs, used to skip the file in later batches
+        with open(_get_out_statistic(infile, window, statistic, kwargs) + ".settings", "w") as f:
+            f.write(_get_settings_hash(window, statistic, kwargs))
+        status, error = "finished", ""
+    except Exception:
+        status, error = "failed", traceback.format_exc()
+    return {"infile": str(infile), "status": status, "seconds": time.perf_counter() - start, "error": error}
+
+
+def get_parser():
+    """ Create a parser object to read user inputs from the command line."""
+    parser = argparse.ArgumentParser(description="Run weighslide for many input files.")
+
+    # add command-line options
+    parser.add_argument("w",  # "--window",
+                        help="Sliding weighted window, as for a single input file (e.g. 393x393x393).")
+    parser.add_argument("s",  # "--statistic",
+                        default="mean",
+                        type=_get_statistic_argument,
+                        help="The choices are mean, std, sum, median, min, max, or a quantile (e.g. q90).")
+    parser.add_argument("-i",  # "--inputs",
+                        required=True,
+                        help='Directory, glob pattern (e.g. "D:/data/*.csv") or manifest .txt file with one path per '
+                             'line.')
+    parser.add_argument("-p",  # "--processes",
+                        type=int, default=None,
+                        help="Number of worker processes. The default is the number of CPUs.")
+    parser.add_argument("-c",  # "--column",
+                        default=None,
+                        help='Column name in input files that should be used for analysis. E.g. "data values"')
+    parser.add_argument("-a",  # "--all",
+                        type=str, default="False",
+                        help="If True, all files are analysed, even if the outputs are up-to-date.")
+    parser.add_argument("-f",  # "--output_format",
+                        default="csv", choices=["csv", "parquet", "feather", "npy"],
+                        help="Format of the output data files.")
+    parser.add_argument("-r",  # "--report",
+                        default=None,
+                        help="Path of a csv file for the summary report.")
+
+    return parser
+
+
+def main(argv=None):
+    """ Run weighslide from the command line."""
+    # obtain command-line arguments
+    args = get_parser().parse_args(argv)
+
+    # if the window looks like a python list (i.e., it starts with "["), convert it from stringlist to list
+    if args.w[0] == "[":
+        window = ast.literal_eval(args.w)
+    else:
+        window = args.w
+
+    if args.a in ["True", "true", "TRUE"]:
+        skip_up_to_date = False
+    elif args.a in ["False", "false", "FALSE"]:
+        skip_up_to_date = True
+    else:
+        raise ValueError('Variable "{}" is not recognised. Accepted values are "True" or "False".'.format(args.a))
+
+    summary_df = run_weighslide_batch(args.i, window, args.s, processes=args.p, skip_up_to_date=skip_up_to_date,
+                                      report=args.r, column=args.c, output_format=args.f)
+    print(summary_df[["infile", "status", "seconds"]].to_string(index=False))
+
+
+# if batch.py is run as the main python script, obtain the options from the command line.
+if __name__ == '__main__':
+    main()
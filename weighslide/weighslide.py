@@ -1,13 +1,36 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Union
 
 import numpy as np
 import pandas as pd
 import os
-import matplotlib.pyplot as plt
 import argparse
 import ast
+import contextlib
+import functools
+import hashlib
+import importlib.util
 import sys
+import time
+import warnings
+from numpy.lib.stride_tricks import sliding_window_view
+
+# maximum number of values in the temporary array of multiplied slices
+_BLOCK_ELEMENTS = 2 ** 20
+# windows of at least this length use the FFT engine, when engine="auto"
+_FFT_MIN_WINDOW_LENGTH = 32
+# series of at least this length use the numba engine, when engine="auto". For shorter series, the direct engine is
+# faster than loading or compiling the numba kernel.
+_NUMBA_MIN_SERIES_LENGTH = 2 * 10 ** 6
+# minimum FFT length used in the FFT engine
+_FFT_BLOCK_MIN = 2 ** 14
+# maximum number of cells in the dataframes of slices (data_series_len * (data_series_len + window_length - 1))
+# (at least 10000 positions with a window of 101 positions, the limits of earlier versions)
+_BAND_MAX_CELLS = 11 * 10 ** 7
+# windows with up to this number of different weights have an exact weight spread, for the std of the FFT engine and
+# the window bank
+_MAX_UNIQUE_WEIGHTS = 16
 
 
 def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic: str, **kwargs):
@@ -35,7 +58,7 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
                  [   0.66  ]
                     [   2.33  ]
                        [  3.66  ] and so on.
-    The "statistic" can be mean, std, or sum.
+    The "statistic" can be mean, std, sum, median, min, max, or a quantile (e.g. "q90" for the 90th percentile).
     The value (in this case the mean) will replace the central position in the output 1D array.
     output = [ 0.00  0.00  0.66  2.33  3.66  6.00  9.66  15.6  25.3  41.0  65.5  ]
     The first and last array slices always contain "not a number" (Nan) values, which are ignored in all calculations.
@@ -44,7 +67,7 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
     Parameters
     ----------
     infile : string
-        Path to csv or excel file containing the data to be analysed.
+        Path to csv, excel, parquet, feather or npy file containing the data to be analysed.
     window : list or string
         The user-defined window that determines the size of the slices in the array, and the weight of each value in
         the slice. Can be a list of integers or floats (e.g. [2,5,2]). Can also be a string of numbers that will be
@@ -53,7 +76,8 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
         annoted with "x", for example [2,"x",2], or "4x4" will be converted to [2,np.nan,2] and [0.5,np.nan,0.5]
         respectively.
     statistic : string
-        Statistical algorithm to be applied to the weighted slice. The options are "mean", "std", or "sum".
+        Statistical algorithm to be applied to the weighted slice. The options are "mean", "std", "sum", "median",
+        "min", "max", or a quantile given as "q" followed by a percentage (e.g. "q90" or "q2.5").
 
     Keyword arguments (optional):
     ----------
@@ -61,13 +85,69 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
         Short name used to describe sample or experiment. If given, will be included in output filename.
     column : string
         In excel or csv input files with headers, this is the column name containing the data to analyse.
-        The default is the first column of the dataset.
+        The default is the first column of the dataset. For 2D npy input files, this is the column index.
     overwrite : boolean
         If True, output files with the same name will be overwritten. If False, any existing outputfiles will result
         in an error.
     showfig : boolean
         If True, the output figure will be shown as a popup window, or in IPython/Jupyter.
         For Ipython/Jupyter it is recommended to precede weighslide with the magic command %matplotlib inline.
+        If False (default), the figure is drawn without a graphical backend, which is faster and also works on
+        servers without a display.
+    plot : boolean
+        If True (default), out_png is saved. If False, no figure is created, which is recommended for batch jobs.
+    plot_points : int
+        Long data series are downsampled for plotting, by keeping the minimum and maximum value within each of
+        plot_points intervals. This preserves peaks, and is much faster than plotting every point. The default is
+        2000, which is more than the width of the figure in pixels. If None, all points are plotted.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+    workers : int
+        Number of threads used for the calculation. See calculate_weighted_windows.
+    dtype : string
+        Float type of the calculation, "float64" (default) or "float32". float32 halves the memory of the data and
+        output. See calculate_weighted_windows.
+    columns : list or string
+        List of column names in the input file, or "all" for all numeric columns. If given, the window is applied to
+        each column in a single calculation, and out_statistic and out_excelfile contain one output column per
+        input column. The slices and figure are not saved.
+    group_column : string
+        Name of a column with the ID of each data series, for input files with many series stacked in one table
+        (e.g. thousands of proteins). The windows do not cross the boundaries between series, and all series are
+        processed in a single calculation. See calculate_weighted_windows_grouped. out_statistic and out_excelfile
+        contain the ID column and the output column, in the row order of the input file. The slices and figure are
+        not saved.
+    chunksize : int
+        If given, the csv input file is read and processed in chunks of this many rows, and only out_statistic is saved
+        in csv format. Memory use is bounded by the chunk size, rather than the file size. The results are identical to
+        processing the whole file at once (within FFT rounding, if the "fft" engine is used).
+    diagnostics : boolean
+        If True (default), the slices and multiplied slices are saved (out_slice, out_mult, and the
+        corresponding excel sheets). If False, the slices are never created, which is much faster for long datasets.
+        In csv and excel files, the slices are saved as a table with one column per position. If this table would be
+        too large for memory (more than about 10000 positions), it is skipped with a warning. Binary output formats
+        save the slices with one slice per row, and have no limit.
+    output_format : string
+        Format of out_statistic, out_slice and out_mult. The options are "csv" (default), "parquet", "feather"
+        (both require pyarrow), or "npy". Binary formats are much faster to write and read than csv.
+    excel : boolean
+        If True (default), out_excelfile is saved. Writing excel files is slow, and is best avoided for long datasets.
+    cache : ResultCache, Path or string
+        Cache of previous results, or the directory of the cache. If the data column has already been analysed
+        with the same window and statistic, the output is loaded from the cache instead of being recalculated.
+    verbose : boolean
+        If True (default), messages are printed at the start and end of the analysis.
+    progress : boolean or function
+        If True, progress is shown by printing dots. If False, progress is not shown. If a function is given, it is
+        called as progress(positions_done, positions_total) during the calculation. The positions_total is None
+        in chunked processing, as the length of the input file is not known. The default is the value of verbose.
+    hook : function
+        If given, called as hook(stage, seconds, bytes) after each stage of the analysis. See WeighslideMetrics.
+    write_workers : int
+        Number of threads used to write the output files. If None (default), all output files (slices, statistic,
+        excel and png) are written concurrently. If 1, they are written one after another. Each file is written
+        under a temporary name, and renamed when it is complete, so that an interrupted analysis never leaves
+        incomplete output files.
     excel_kwargs : dictionary
         Keyword arguments necessary for pandas to read the input excel file.
         E.g. {"sheet_name" : "datasheet", "header" : 0, "skiprows : 3}
@@ -75,22 +155,29 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
         Keyword arguments necessary for pandas to read the input csv file.
         E.g. {"delimiter" : ",", "skiprows : 3}
 
+    Returns
+    -------
+    metrics : WeighslideMetrics
+        Duration and size in bytes of each stage of the analysis (read, window, compute, csv_write, excel_write,
+        plot, etc.). The write stage is named after the output_format (e.g. parquet_write).
+
     Saved Files and Figures
     -------
     All output files are saved in a subfolder based on the input xlsx or csv file:
     D:/Path/To/Your/Input/File/weighslide_output/
 
-    out_csv_statistic : csv
+    out_statistic : csv, parquet, feather or npy
         Output file after applying weighslide to the input list of numerical values.
         Consists of a list of values, of the same length as the original input list.
         Filename will reflect that statistical method used (e.g. YourExperimentName_mean.csv for statistic = "mean")
-    out_csv_slice : csv
+    out_slice : csv, parquet, feather or npy
         Shows all slices from the original 1D array/list. Filesize is ~1200 kb for an input list of size 1000.
-    out_csv_mult : csv
+        In binary formats, this is a matrix with one slice per row, and one column per window position.
+    out_mult : csv, parquet, feather or npy
         Shows the values in all slices after multiplication against the window.
         Filesize is ~1200 kb for an input list of size 1000.
     out_excelfile : excel (.xlsx)
-        The three output datasets (out_csv_statistic, out_csv_slice, and out_csv_mult) are saved on separate sheets.
+        The three output datasets (out_statistic, out_slice, and out_mult) are saved on separate sheets.
         Due to compression, filesize is efficient, with ~150 kb for an input list of size 1000.
     out_png : png image
         Very simple and unannotated figure showing a line graph of the original data, in combination with the output
@@ -98,71 +185,62 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
 
     Note
     -------
-    Weighslide is not currently optimised for performance. Input arrays must have <10 000 datapoints.
+    The sliding-window calculation is vectorised, and has no limit on the length of the input data or window.
+    The out_slice, out_mult (in csv format) and out_excelfile outputs grow with the square of the input length, and
+    are only practical for input arrays with <10 000 datapoints.
     """
-    print("Starting weighslide analysis.")
+    # determine the user variables for progress and timing reports
+    verbose = kwargs["verbose"] if "verbose" in kwargs.keys() else True
+    progress = kwargs["progress"] if "progress" in kwargs.keys() else verbose
+    metrics = WeighslideMetrics(hook=kwargs["hook"] if "hook" in kwargs.keys() else None)
 
-    # if the infile ends in .xls or .xlsx, open with excel_kwargs, if available
-    filetype = str(infile.name).split(".")[-1]
-    if filetype == "xlsx" or filetype == "xls":
-        if "excel_kwargs" in kwargs.keys():
-            df = pd.read_excel(infile, **kwargs["excel_kwargs"])
-        else:
-            df = pd.read_excel(infile)
-    # if the infile ends in .csv, open with csv_kwargs, if available
-    elif filetype == "csv":
-        if "csv_kwargs" in kwargs:
-            if kwargs["csv_kwargs"] is not None:
-                df = pd.read_csv(infile, **kwargs["csv_kwargs"])
-            else:
-                df = pd.read_csv(infile)
-        else:
-            df = pd.read_csv(infile)
-    else:
-        raise ValueError("Filetype must be excel or csv, and have an .xlsx, .xls, or .csv extension.")
+    if verbose:
+        print("Starting weighslide analysis.")
 
-    # if the dataframe only has a single column, use it as the input data
-    if df.shape[1] == 1:
-        data_series = df.iloc[:, 0]
-    # if the dataframe has multiple columns, search in the kwargs for the appropriate column name for input data
-    elif df.shape[1] > 1:
-        if "column" in kwargs.keys() and kwargs["column"] is not None:
-            column = kwargs["column"]
-            # select data column
-            data_series = df[column]
-        else:
-            raise ValueError(r'No column name provided. The input file "{}" appears to have multiple columns, and '
-                             r'therefore the column name with data needs to be input as a column '
-                             r'variable.'.format(infile))
-    else:
-        raise ValueError(f"Input data not found. Imported {filetype} file '{infile}' has {df.shape[1]} columns")
+    # determine the user variable "chunksize". If given, the input csv is processed in chunks of this many rows.
+    chunksize = kwargs["chunksize"] if "chunksize" in kwargs.keys() else None
 
-    # get the path of the input file
-    split_input_filepath = os.path.split(infile)
-    inpath = split_input_filepath[0]
+    # determine the user variable "columns". If given, all listed columns are processed together.
+    columns = kwargs["columns"] if "columns" in kwargs.keys() else None
 
-    # get the sample/experiment name from input variables, otherwise use the first 20 characters of filename
-    if "name" in kwargs.keys():
-        out_name = kwargs["name"][:20]
-    else:
-        out_name = split_input_filepath[1][:20]
+    # determine the user variable "group_column". If given, all data series in the table are processed together.
+    group_column = kwargs["group_column"] if "group_column" in kwargs.keys() else None
+    column = kwargs["column"] if "column" in kwargs.keys() else None
+    if group_column is not None and columns is not None:
+        raise ValueError('The "columns" and "group_column" variables cannot be used together.')
 
-    # if the window is a string, use first 20 characters in output filenames
-    if type(window) == str:
-        window_str = window[:20]
+    filetype = str(Path(infile).name).split(".")[-1]
+    if chunksize is not None:
+        if filetype != "csv":
+            raise ValueError("Chunked processing (chunksize={}) requires a csv input file.".format(chunksize))
     else:
-        # the list of weightings is probably not suitable to include in a filename. Use an empty string.
-        window_str = ""
+        with metrics.stage("read") as stage:
+            if columns is not None:
+                # the input file is parsed only once for all columns
+                df = _read_input_file(infile, usecols=columns if type(columns) == list else None, **kwargs)
+            elif group_column is not None:
+                df = _read_input_file(infile, usecols=[group_column, column] if column is not None else None,
+                                      **kwargs)
+            else:
+                data_series = _read_data_series(infile, **kwargs)
+            stage["bytes"] = os.path.getsize(infile)
 
-    # create a base name for the output files. Greate directory. Create output paths for excel, csv and png files.
-    outpath = os.path.join(inpath, "weighslide_output")
+    # get the output directory and base name of the output files
+    name = kwargs["name"] if "name" in kwargs.keys() else None
+    inpath, outpath, out_basename = _get_out_basename(infile, window, name)
     if not os.path.isdir(outpath):
         os.mkdir(outpath)
-    out_basename = os.path.join(outpath, out_name + window_str)
+    # determine the user variables "output_format" and "excel"
+    output_format = kwargs["output_format"] if "output_format" in kwargs.keys() else "csv"
+    if output_format not in ["csv", "parquet", "feather", "npy"]:
+        raise ValueError("The 'output_format' variable is not recognised. \nPlease check that the variable "
+                         "is either 'csv', 'parquet', 'feather', or 'npy'.")
+    excel = kwargs["excel"] if "excel" in kwargs.keys() else True
+
     out_excelfile = out_basename + ".xlsx"
-    out_csv_slice = out_basename + "_sliced" + ".csv"
-    out_csv_mult = out_basename + "_mult" + ".csv"
-    out_csv_statistic = out_basename + "_{}".format(statistic) + ".csv"
+    out_slice = out_basename + "_sliced" + "." + output_format
+    out_mult = out_basename + "_mult" + "." + output_format
+    out_statistic = out_basename + "_{}".format(statistic) + "." + output_format
     out_png = out_basename + ".png"
 
     # determine the user variable "overwrite"
@@ -171,36 +249,120 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
     else:
         overwrite = False
 
+    # determine the user variable "diagnostics"
+    diagnostics = kwargs["diagnostics"] if "diagnostics" in kwargs.keys() else True
+
+    # determine the user variable "plot"
+    plot = kwargs["plot"] if "plot" in kwargs.keys() else True
+
     # check if output files exist. Raise error if they exist, and "overwrite" is not True
-    list_check_if_existing = [out_excelfile, out_csv_slice, out_csv_mult, out_csv_statistic, out_png]
+    list_check_if_existing = [out_statistic]
+    if chunksize is None:
+        if excel:
+            list_check_if_existing.append(out_excelfile)
+        if columns is None and group_column is None:
+            if plot:
+                list_check_if_existing.append(out_png)
+            if diagnostics:
+                list_check_if_existing += [out_slice, out_mult]
     for filepath in list_check_if_existing:
         if os.path.exists(filepath):
             if not overwrite:
                 raise FileExistsError('\nOutput files already exist. To overwrite files, please change the'
                                       ' "overwrite" variable to True.')
 
-    # run the algorithm to calculate the weighted windows
-    window_array, df_orig_sliced, df_multiplied, output_series = calculate_weighted_windows(data_series,
-                                                                                            window, statistic)
+    # determine the user variables "engine", "workers", "dtype" and "write_workers"
+    engine = kwargs["engine"] if "engine" in kwargs.keys() else "auto"
+    workers = kwargs["workers"] if "workers" in kwargs.keys() else None
+    dtype = kwargs["dtype"] if "dtype" in kwargs.keys() else "float64"
+    write_workers = kwargs["write_workers"] if "write_workers" in kwargs.keys() else None
 
-    # save output files to csv
-    df_orig_sliced.to_csv(out_csv_slice)
-    df_multiplied.to_csv(out_csv_mult)
-    output_series.to_csv(out_csv_statistic)
+    if chunksize is not None:
+        # only the output statistic is saved, as the full data is never held in memory
+        if output_format != "csv":
+            raise ValueError("Chunked processing (chunksize={}) requires the csv output format.".format(chunksize))
+        csv_kwargs = kwargs["csv_kwargs"] if "csv_kwargs" in kwargs.keys() else None
+        # reading, calculation and writing are interleaved, and are reported as a single stage
+        with metrics.stage("chunked") as stage:
+            _write_atomic(out_statistic, lambda path: _write_weighted_windows_chunked(
+                infile, window, statistic, path, chunksize, engine=engine, column=column, csv_kwargs=csv_kwargs,
+                progress=progress))
+            stage["bytes"] = os.path.getsize(out_statistic)
+        _print_finished(verbose, inpath, outpath)
+        return metrics
 
-    # print dot showing progress
-    sys.stdout.write(".")
-    sys.stdout.flush()
+    if columns is not None or group_column is not None:
+        # calculate all columns or series together. Slices and figures are not created.
+        with metrics.stage("compute") as stage:
+            if columns is not None:
+                output_df = calculate_weighted_windows_table(df, window, statistic, columns=columns, engine=engine,
+                                                             progress=progress, workers=workers, dtype=dtype)
+            else:
+                output_series = calculate_weighted_windows_grouped(df, window, statistic, group_column,
+                                                                   column=column, engine=engine, progress=progress)
+                # keep the ID of each row next to the output
+                output_df = pd.concat([df[group_column].set_axis(output_series.index), output_series], axis=1)
+            stage["bytes"] = output_df.to_numpy().nbytes
 
-    # save output files to excel
-    with pd.ExcelWriter(out_excelfile) as writer:
-        df_orig_sliced.to_excel(writer, sheet_name="orig_data_sliced")
-        df_multiplied.to_excel(writer, sheet_name="data_multipled")
-        output_series.to_frame(name="window_{}".format(statistic)).to_excel(writer, sheet_name="window_{}".format(statistic))
+        def write_excel(path):
+            with pd.ExcelWriter(path) as writer:
+                output_df.to_excel(writer, sheet_name="window_{}".format(statistic))
+
+        write_tasks = [("{}_write".format(output_format), out_statistic,
+                        functools.partial(_save_table, output_df, output_format=output_format))]
+        if excel:
+            write_tasks.append(("excel_write", out_excelfile, write_excel))
+        _write_outputs(write_tasks, metrics, write_workers)
+        _print_finished(verbose, inpath, outpath)
+        return metrics
+
+    # determine the user variable "cache"
+    cache = kwargs["cache"] if "cache" in kwargs.keys() else None
 
-    # print dot showing progress
-    sys.stdout.write(".")
-    sys.stdout.flush()
+    # the slices are saved in csv or excel files as dataframes with one column per position, unless they would be
+    # too large for memory
+    save_band = diagnostics and (output_format == "csv" or excel)
+    if save_band and _band_is_too_large(len(data_series), len(compile_window(window))):
+        warnings.warn("The input data has {} positions, and the tables of slices are too large to be saved in csv or "
+                      "excel format. The slices are not saved in csv or excel files. Use a binary output_format "
+                      "(e.g. 'npy') to save the slices.".format(len(data_series)))
+        save_band = False
+
+    # run the algorithm to calculate the weighted windows. Slices are only created if diagnostics are saved.
+    result = calculate_weighslide_result(data_series, window, statistic, engine=engine, cache=cache,
+                                         progress=progress, metrics=metrics, workers=workers, dtype=dtype)
+    output_series = result.output_series
+
+    # the dataframes of slices are created before writing, as they are shared by the csv and excel writers
+    if save_band:
+        df_orig_sliced, df_multiplied = result.df_orig_sliced, result.df_multiplied
+
+    def write_excel(path):
+        with pd.ExcelWriter(path) as writer:
+            if save_band:
+                df_orig_sliced.to_excel(writer, sheet_name="orig_data_sliced")
+                df_multiplied.to_excel(writer, sheet_name="data_multipled")
+            output_series.to_frame(name="window_{}".format(statistic)).to_excel(writer, sheet_name="window_{}".format(statistic))
+
+    # save output files. In csv format, the slices are saved in the layout of df_orig_sliced and df_multiplied.
+    # In binary formats, they are saved as float matrices with one slice per row.
+    table_stage = "{}_write".format(output_format)
+    write_tasks = []
+    if diagnostics:
+        if output_format == "csv":
+            if save_band:
+                write_tasks.append((table_stage, out_slice, df_orig_sliced.to_csv))
+                write_tasks.append((table_stage, out_mult, df_multiplied.to_csv))
+        else:
+            write_tasks.append((table_stage, out_slice, functools.partial(
+                _save_table, _get_slice_dataframe(result.sliced_array), output_format=output_format)))
+            write_tasks.append((table_stage, out_mult, functools.partial(
+                _save_table, _get_slice_dataframe(result.multiplied_array), output_format=output_format)))
+    write_tasks.append((table_stage, out_statistic,
+                        functools.partial(_save_table, output_series, output_format=output_format)))
+    # save output files to excel
+    if excel:
+        write_tasks.append(("excel_write", out_excelfile, write_excel))
 
     ############################################################
     #                                                          #
@@ -208,9 +370,67 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
     #                                                          #
     ############################################################
 
-    fig, ax = plt.subplots()
-    ax.plot(data_series)
-    ax.plot(output_series)
+    showfig = kwargs["showfig"] if "showfig" in kwargs.keys() else False
+    plot_points = kwargs["plot_points"] if "plot_points" in kwargs.keys() else 2000
+
+    def write_png(path):
+        _plot_output(data_series, output_series, window, path, showfig=showfig, plot_points=plot_points)
+
+    # figures shown with pyplot must be created in the main thread
+    if plot and not showfig:
+        write_tasks.append(("plot", out_png, write_png))
+    _write_outputs(write_tasks, metrics, write_workers, progress)
+    if plot and showfig:
+        _write_outputs([("plot", out_png, write_png)], metrics, 1)
+
+    _print_finished(verbose, inpath, outpath)
+    return metrics
+
+
+def _print_finished(verbose, inpath, outpath):
+    """ Print the final message of run_weighslide, with the location of the output files."""
+    if verbose:
+        print("\nWeighslide analysis is finished.")
+        if len(inpath) > 1:
+            print("\nLocation of output files:\n\t{}".format(outpath))
+
+
+def _plot_output(data_series, output_series, window, out_png, showfig=False, plot_points=2000):
+    """ Plot the output data vs the original, and save as png.
+
+    Parameters
+    ----------
+    data_series : pd.Series
+        Original data.
+    output_series : pd.Series
+        Output data after applying weighslide.
+    window : list or string
+        The user-defined window, shown in the title.
+    out_png : string
+        Path of the png file.
+    showfig : boolean
+        If True, the figure is created with pyplot and shown. Otherwise, the figure is drawn without a graphical
+        backend, and pyplot is not used.
+    plot_points : int
+        Number of intervals for min/max downsampling of long series. If None, all points are plotted.
+    """
+    # matplotlib is only imported when needed, as it is slow to import
+    if showfig:
+        import matplotlib.pyplot as plt
+        fig, ax = plt.subplots()
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure()
+        ax = fig.subplots()
+
+    for series, label in [(data_series, "original data"), (output_series, output_series.name)]:
+        x_values = series.index.to_numpy()
+        y_values = series.to_numpy(dtype=float)
+        if plot_points is not None:
+            indices = _get_minmax_indices(y_values, plot_points)
+            x_values, y_values = x_values[indices], y_values[indices]
+        ax.plot(x_values, y_values, label=label)
+
     ax.set_xlabel("position")
     ax.set_ylabel("value")
     window_string = str(window)
@@ -220,33 +440,434 @@ def run_weighslide(infile: Union[Path, str], window: Union[list, str], statistic
     min_value = min(data_series.min(), output_series.min())
     ax.set_ylim(min_value * 0.8, max_value * 1.2)
     lgd = ax.legend()
-    plt.tight_layout()
+    fig.tight_layout()
     fig.savefig(out_png, format='png', dpi=200)
-    if "showfig" in kwargs.keys():
-        if kwargs["showfig"] == True:
-            plt.show()
+    if showfig:
+        plt.show()
+        # close the figure, so that repeated runs do not accumulate open figures
+        plt.close(fig)
+
+
+def _get_minmax_indices(y_values, n_intervals):
+    """ Get the positions of the minimum and maximum value in each interval of a 1D array, for downsampling.
+
+    The array is split into n_intervals of equal length. The positions of the minimum and maximum within each
+    interval are returned in their original order, so that the downsampled line has the same peaks and troughs.
+    NaN values are ignored, unless an interval contains only NaN.
+
+    Parameters
+    ----------
+    y_values : np.ndarray
+        1D float array.
+    n_intervals : int
+        Number of intervals. Arrays with fewer than 2 * n_intervals values are not downsampled.
+
+    Returns
+    -------
+    indices : np.ndarray
+        Sorted integer positions in y_values.
+    """
+    n_values = len(y_values)
+    if n_values <= 2 * n_intervals:
+        return np.arange(n_values)
+    interval_length = int(np.ceil(n_values / n_intervals))
+    n_intervals = int(np.ceil(n_values / interval_length))
+    # pad with NaN, so that all intervals have the same length
+    padded = np.full(n_intervals * interval_length, np.nan)
+    padded[:n_values] = y_values
+    intervals = padded.reshape(n_intervals, interval_length)
+    # NaN are replaced by values that are never selected, unless the whole interval is NaN
+    argmin = np.argmin(np.where(np.isnan(intervals), np.inf, intervals), axis=1)
+    argmax = np.argmax(np.where(np.isnan(intervals), -np.inf, intervals), axis=1)
+    starts = np.arange(n_intervals) * interval_length
+    indices = np.concatenate([starts + argmin, starts + argmax])
+    indices = np.unique(indices[indices < n_values])
+    return indices
+
+
+def _get_out_basename(infile, window, name=None):
+    """ Get the location of the output files for an input file.
+
+    Parameters
+    ----------
+    infile : string or Path
+        Path to csv or excel file containing the data to be analysed.
+    window : list or string
+        The user-defined window.
+    name : string
+        Short name of the sample or experiment, used in full. If None, the first 20 characters of the filename of
+        the infile are used.
+
+    Returns
+    -------
+    inpath : string
+        Directory of the input file.
+    outpath : string
+        Directory of the output files ("weighslide_output" in the input directory). The directory is not created.
+    out_basename : string
+        Path of the output files, without the suffix and extension.
+    """
+    # get the path of the input file
+    split_input_filepath = os.path.split(infile)
+    inpath = split_input_filepath[0]
+
+    # get the sample/experiment name from input variables, otherwise use the first 20 characters of filename.
+    # A given name is used in full, so that names that only differ at the end (e.g. in a batch) give unique outputs.
+    if name is not None:
+        out_name = name
+    else:
+        out_name = split_input_filepath[1][:20]
+
+    # if the window is a string, use first 20 characters in output filenames
+    if type(window) == str:
+        window_str = window[:20]
+    else:
+        # the list of weightings is probably not suitable to include in a filename. Use an empty string.
+        window_str = ""
+
+    # create a base name for the output files
+    outpath = os.path.join(inpath, "weighslide_output")
+    out_basename = os.path.join(outpath, out_name + window_str)
+    return inpath, outpath, out_basename
+
+
+def _write_atomic(outfile, write_function):
+    """ Write a file under a temporary name in the same directory, and rename it to outfile when it is complete.
+
+    The rename replaces any existing file in a single step, so that outfile is never incomplete, even if the
+    analysis is interrupted. If write_function raises an error, the temporary file is deleted, and the error is raised.
+
+    Parameters
+    ----------
+    outfile : string or Path
+        Path of the output file.
+    write_function : function
+        Called as write_function(path) to save the file. The temporary path has the same extension as outfile, as
+        pandas, numpy and matplotlib select the file format from the extension.
+    """
+    root, extension = os.path.splitext(str(outfile))
+    temp_file = root + ".tmp" + extension
+    try:
+        write_function(temp_file)
+        os.replace(temp_file, outfile)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def _write_outputs(write_tasks, metrics, workers=None, progress=None):
+    """ Write the output files of run_weighslide concurrently in a pool of threads.
+
+    All files are written, even if one of the writers fails. The first error (in the order of write_tasks) is then
+    raised. Each file is written atomically, so that failed writers do not leave incomplete files.
+
+    Parameters
+    ----------
+    write_tasks : list
+        List of (stage, outfile, write_function) tuples. Each write_function saves one file, and is called as
+        write_function(path). See _write_atomic.
+    metrics : WeighslideMetrics
+        The duration and file size of each stage are added to the metrics, in the order of write_tasks. The duration
+        is the sum of the durations of the writers of the stage. As the writers run concurrently, the total
+        duration of the stages can be longer than the time taken to write all files.
+    workers : int
+        Number of threads. If None (default), each file is written in a separate thread. If 1, the files are written
+        one after another in the current thread.
+    progress : boolean or function
+        If True, a dot is printed after each file.
+    """
+    if len(write_tasks) == 0:
+        return
+
+    def write(outfile, write_function):
+        start = time.perf_counter()
+        _write_atomic(outfile, write_function)
+        if progress is True:
+            sys.stdout.write(".")
+            sys.stdout.flush()
+        return time.perf_counter() - start, os.path.getsize(outfile)
+
+    if workers == 1:
+        results = [write(outfile, write_function) for stage, outfile, write_function in write_tasks]
+    else:
+        with ThreadPoolExecutor(max_workers=workers if workers is not None else len(write_tasks)) as executor:
+            futures = [executor.submit(write, outfile, write_function) for stage, outfile, write_function in write_tasks]
+        # all writers are finished. Raise the first error, if any.
+        results = [future.result() for future in futures]
+
+    # sum the duration and bytes of all files of each stage. Dictionaries keep the order of the stages.
+    stages = {}
+    for (stage, outfile, write_function), (seconds, nbytes) in zip(write_tasks, results):
+        seconds_sum, nbytes_sum = stages.get(stage, (0.0, 0))
+        stages[stage] = (seconds_sum + seconds, nbytes_sum + nbytes)
+    for stage, (seconds, nbytes) in stages.items():
+        metrics.add(stage, seconds, nbytes)
+
+
+def _save_table(data, outfile, output_format):
+    """ Save a series or dataframe in csv, parquet, feather or npy format.
+
+    In csv, parquet and feather format, the index is saved as the first column. In npy format, only the values are
+    saved, as a 1D array for a series, or a 2D array for a dataframe.
+    """
+    if output_format == "csv":
+        data.to_csv(outfile)
+    elif output_format == "npy":
+        np.save(outfile, data.to_numpy())
+    else:
+        df = data.to_frame() if isinstance(data, pd.Series) else data
+        # parquet and feather require string column names. Feather does not save the index.
+        df = df.rename(columns=str).reset_index()
+        if output_format == "parquet":
+            df.to_parquet(outfile, index=False)
+        elif output_format == "feather":
+            df.to_feather(outfile)
+
+
+def _get_slice_dataframe(slice_array):
+    """ Convert a (data_series_len, window_length) array of slices to a dataframe.
+
+    The index is the central position of each slice, and the columns are the positions relative to the centre.
+    """
+    data_series_len, window_length = slice_array.shape
+    extension_each_side = int((window_length - 1) / 2)
+    columns = [str(i) for i in range(-extension_each_side, extension_each_side + 1)]
+    return pd.DataFrame(slice_array, index=pd.RangeIndex(data_series_len, name="position"), columns=columns)
+
+
+def _read_input_file(infile, usecols=None, **kwargs):
+    """ Read a csv, excel, parquet, feather or npy input file into a dataframe.
+
+    Parameters
+    ----------
+    infile : string or Path
+        Path to the file containing the data to be analysed.
+    usecols : list
+        If given, only these columns are read from parquet, feather and npy files.
+        Columns in npy files are integer positions.
+    kwargs : dict
+        excel_kwargs and csv_kwargs, as in run_weighslide.
+
+    Returns
+    -------
+    df : pd.DataFrame
+    """
+    # if the infile ends in .xls or .xlsx, open with excel_kwargs, if available
+    filetype = str(Path(infile).name).split(".")[-1]
+    if filetype == "xlsx" or filetype == "xls":
+        if "excel_kwargs" in kwargs.keys() and kwargs["excel_kwargs"] is not None:
+            df = pd.read_excel(infile, **kwargs["excel_kwargs"])
+        else:
+            df = pd.read_excel(infile)
+    # if the infile ends in .csv, open with csv_kwargs, if available
+    elif filetype == "csv":
+        if "csv_kwargs" in kwargs:
+            if kwargs["csv_kwargs"] is not None:
+                df = pd.read_csv(infile, **kwargs["csv_kwargs"])
+            else:
+                df = pd.read_csv(infile)
+        else:
+            df = pd.read_csv(infile)
+    # binary columnar files. Only the selected columns are read.
+    elif filetype == "parquet":
+        df = pd.read_parquet(infile, columns=usecols)
+    elif filetype == "feather":
+        df = pd.read_feather(infile, columns=usecols)
+    # numpy arrays are memory-mapped. Columns are named by their integer position.
+    elif filetype == "npy":
+        array = np.load(infile, mmap_mode="r")
+        df = pd.DataFrame(array.reshape(len(array), -1))
+        if usecols is not None:
+            df = df[usecols]
+    else:
+        raise ValueError("Filetype must be excel, csv, parquet, feather or npy, and have an .xlsx, .xls, .csv, "
+                         ".parquet, .feather or .npy extension.")
+
+    return df
+
+
+def _read_data_series(infile, **kwargs):
+    """ Read the input data column from a csv, excel, parquet, feather or npy file.
+
+    Parameters
+    ----------
+    infile : string or Path
+        Path to the file containing the data to be analysed.
+    kwargs : dict
+        column, excel_kwargs and csv_kwargs, as in run_weighslide.
+
+    Returns
+    -------
+    data_series : pd.Series
+    """
+    filetype = str(Path(infile).name).split(".")[-1]
+    column = kwargs["column"] if "column" in kwargs.keys() else None
+
+    if filetype == "npy":
+        # memory-map the array, so that only the selected column is read from disk
+        array = np.load(infile, mmap_mode="r")
+        if array.ndim == 1:
+            return pd.Series(np.array(array, dtype=float))
+        elif column is not None:
+            return pd.Series(np.array(array[:, int(column)], dtype=float))
+        elif array.shape[1] == 1:
+            return pd.Series(np.array(array[:, 0], dtype=float))
+        raise ValueError(r'No column name provided. The input file "{}" appears to have multiple columns, and '
+                         r'therefore the column index with data needs to be input as a column '
+                         r'variable.'.format(infile))
+
+    # only the selected column is read from binary columnar files
+    if filetype in ["parquet", "feather"] and column is not None:
+        df = _read_input_file(infile, usecols=[column], **kwargs)
+    else:
+        df = _read_input_file(infile, **kwargs)
+
+    # if the dataframe only has a single column, use it as the input data
+    if df.shape[1] == 1:
+        data_series = df.iloc[:, 0]
+    # if the dataframe has multiple columns, search in the kwargs for the appropriate column name for input data
+    elif df.shape[1] > 1:
+        if "column" in kwargs.keys() and kwargs["column"] is not None:
+            column = kwargs["column"]
+            # select data column
+            data_series = df[column]
+        else:
+            raise ValueError(r'No column name provided. The input file "{}" appears to have multiple columns, and '
+                             r'therefore the column name with data needs to be input as a column '
+                             r'variable.'.format(infile))
+    else:
+        raise ValueError(f"Input data not found. Imported {filetype} file '{infile}' has {df.shape[1]} columns")
+
+    return data_series
+
+
+def _write_weighted_windows_chunked(infile, window, statistic, out_csv_statistic, chunksize, engine="auto",
+                                    progress=True, **kwargs):
+    """ Apply the weighslide algorithm to a csv file in chunks, and append the output to out_csv_statistic.
+
+    Only the selected column is read. The chunks are added to a WeighslideStream, which carries the last
+    window_length - 1 values of each chunk over to the next chunk, so that slices spanning the chunk boundaries are
+    complete.
+
+    Parameters
+    ----------
+    infile : string or Path
+        Path to the csv input file.
+    window : list or string
+        The user-defined window. See calculate_weighted_windows.
+    statistic : string
+        Statistic applied to the weighted slices. See calculate_weighted_windows.
+    out_csv_statistic : string
+        Path of the output csv file.
+    chunksize : int
+        Number of rows read from the input file at a time.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+    progress : boolean or function
+        Progress report after each chunk. See run_weighslide.
+    kwargs : dict
+        column and csv_kwargs, as in run_weighslide.
+    """
+    # the stream carries the last values of each chunk over to the next chunk
+    stream = WeighslideStream(window, statistic, engine=engine)
+
+    csv_kwargs = kwargs["csv_kwargs"] if "csv_kwargs" in kwargs.keys() and kwargs["csv_kwargs"] is not None else {}
+    column = kwargs["column"] if "column" in kwargs.keys() else None
+    if column is not None:
+        csv_kwargs = dict(csv_kwargs, usecols=[column])
+
+    chunks = pd.read_csv(infile, chunksize=chunksize, **csv_kwargs)
+
+    def iter_data_arrays():
+        for df in chunks:
+            if df.shape[1] == 1:
+                yield df.iloc[:, 0].to_numpy(dtype=float)
+            elif column is not None:
+                yield df[column].to_numpy(dtype=float)
+            else:
+                raise ValueError(r'No column name provided. The input file "{}" appears to have multiple columns, and '
+                                 r'therefore the column name with data needs to be input as a column '
+                                 r'variable.'.format(infile))
+
+    with open(out_csv_statistic, "w", newline="") as f:
+        f.write("position,{} over window\n".format(statistic))
+        position = 0
+        progress = _get_progress_function(progress)
+        for output_array in _iter_stream_output(stream, iter_data_arrays()):
+            output_series = pd.Series(output_array, index=pd.RangeIndex(position, position + len(output_array)))
+            output_series.to_csv(f, header=False)
+            position += len(output_array)
+            if progress is not None:
+                progress(position, None)
+
+
+def _iter_stream_output(stream, data_arrays):
+    """ Add consecutive chunks of a data series to a WeighslideStream, and yield the output after each chunk.
 
-    print("\nWeighslide analysis is finished.")
-    if len(inpath) > 1:
-        print("\nLocation of output files:\n\t{}".format(outpath))
+    The output of the last positions is yielded after the final chunk. Empty arrays are not yielded.
+    """
+    for data_array in data_arrays:
+        output_array = stream.update(data_array)
+        if len(output_array) > 0:
+            yield output_array
+    output_array = stream.flush()
+    if len(output_array) > 0:
+        yield output_array
 
 
-def calculate_weighted_windows(data_series, window, statistic, full_output=True):
+def calculate_weighted_windows(data_series, window, statistic, full_output=True, engine="auto", progress=True,
+                               workers=None, dtype="float64", out=None):
     """ Apply the weighslide algorithm to an input series.
 
     Parameters
     ----------
     data_series : pd.Series
         1D array of input data to which the weighslide algorithm will be applied.
-    window : list or string
+    window : list, string or WeighslideWindow
         The user-defined window that determines the size of the slices in the array, and the weight of each value in
         the slice. Can be a list of integers or floats (e.g. [2,5,2]). Can also be a string of numbers that will be
         converted to a list, for example "494" will be converted to [0.5,1.0,0.5], where 0 gives the lowest weighting
         (0.1) and 9 giving the heighest weighting (1.0). In all cases, data to be ignored in the window should be
         annoted with "x", for example [2,"x",2], or "4x4" will be converted to [2,np.nan,2] and [0.5,np.nan,0.5]
-        respectively.
+        respectively. A WeighslideWindow (see compile_window) can also be given, which avoids parsing the window in
+        each call.
     statistic : string
-        Statistical algorithm to be applied to the weighted slice. The options are "mean", "std", or "sum".
+        Statistical algorithm to be applied to the weighted slice. The options are "mean", "std", "sum", "median",
+        "min", "max", or a quantile given as "q" followed by a percentage (e.g. "q90" or "q2.5"). Quantiles use
+        linear interpolation, as in pandas. NaN values in the slice are ignored.
+    full_output : boolean
+        If True, the window_array and dataframes of slices are returned together with the output_series.
+        The dataframes have one column per position, and a ValueError is raised if they would be too large for memory
+        (more than about 10000 positions). Use full_output=False for long data series.
+    engine : string
+        Algorithm used for the calculation. The options are "direct", "fft", "numba", or "auto".
+        "direct" multiplies every slice with the window, and matches a calculation with pandas.
+        "fft" uses convolution, and is much faster for long windows. Results agree with "direct" within floating
+        point rounding (typically <1e-12 relative to the largest weighted value).
+        "numba" uses a compiled kernel that reads each slice once, skipping the "x" positions, and requires the
+        optional numba package. Results agree with "direct" within floating point rounding.
+        "auto" (default) uses "fft" for windows with at least 32 positions. Shorter windows use "numba" for data
+        series of at least 2*10^6 positions if numba is installed, and "direct" otherwise.
+        The median, min, max and quantiles are not available with the "fft" engine. Where all
+        positions of the window have the same weight, they are calculated with sliding-window algorithms, at a
+        cost that increases with the logarithm of the window length.
+    progress : boolean or function
+        If True (default), progress is shown by printing dots for long data series. If False, progress is not shown.
+        If a function is given, it is called as progress(positions_done, positions_total) during the calculation.
+    workers : int
+        Number of threads used for the calculation. If None or 1 (default), the calculation runs in the current
+        thread. Otherwise, the data series is split into chunks that overlap by (window_length - 1) / 2 positions on
+        each side, and the chunks are calculated in parallel. The output is bit-identical to the calculation in a
+        single thread. Parallel calculation is only worthwhile for long data series (e.g. >10^6 positions).
+    dtype : string or np.dtype
+        Float type of the calculation and output, "float64" (default) or "float32". float32 halves the memory of the
+        data and output, and is faster for the direct engine, with a relative precision of about 1e-7 instead of
+        1e-16. The fft engine always calculates in float64, and converts the output to float32.
+    out : np.ndarray
+        Optional preallocated float array or np.memmap of the same length as data_series, into which the output is
+        written. The dtype of out is used for the calculation, and the dtype variable is ignored. The output_series
+        shares memory with out, so that large outputs are never copied.
 
     Returns
     -------
@@ -260,182 +881,1927 @@ def calculate_weighted_windows(data_series, window, statistic, full_output=True)
         Effectively a 2D array of slices, so that the user can double-check the slice+window algorithm.
     output_series : pd.Series
         Pandas Series containing the output data. This is the result after slicing, applying the window, and applying a
-        statistic (mean, std or sum). The series indexb is the range of the original data. The dtype is float.
+        statistic (e.g. mean). The series indexb is the range of the original data. The dtype is float64, or the
+        dtype given by the dtype or out variables.
     """
 
-    data_series.name = "original data"
+    result = calculate_weighslide_result(data_series, window, statistic, engine=engine, progress=progress,
+                                         workers=workers, dtype=dtype, out=out)
 
-    if type(window) == str:
-        # determine length of the window from the user input window
-        window_length = len(window)
-        # split into a list, convert to float, divide by 10 to yield a proportion
-        window_series: pd.Series = pd.Series(list(window))
-        # replace x with np.nan
-        window_series.replace("x", np.nan, inplace=True)
-        # change dtype to float
-        window_series: pd.Series = window_series.astype(float)
-        # convert 0-9 scale to 1-10, divide by 10 to give a relative weighting
-        window_series = (window_series + 1) / 10
-        # convert the series to a numpy array
-        window_array = np.array(window_series).astype(float)
+    if full_output == True:
+        return result.window_array, result.df_orig_sliced, result.df_multiplied, result.output_series
+    else:
+        return result.output_series
 
-    elif type(window) == list:
-        window_length = len(window)
-        # convert the list or series to a numpy array
-        window_series = pd.Series(window)
-        # replace x with np.nan
-        window_series.replace("x", np.nan, inplace=True)
-        # convert the series to a numpy array
-        window_array = np.array(window_series).astype(float)
 
-    else:
-        raise TypeError("The input variable 'window' is neither a string nor a list.")
+def calculate_weighted_windows_table(data_df, window, statistic, columns="all", engine="auto", progress=True,
+                                     workers=None, dtype="float64", out=None):
+    """ Apply the weighslide algorithm to several columns of a dataframe in a single calculation.
 
-    if window_length == 0:
-        raise ValueError("Window length is 0. Please check the 'window' input variable.")
+    The selected columns are converted to a single 2D float array, and all columns are processed together.
+    Each output column is identical to the output of calculate_weighted_windows for that column.
 
-    elif window_length % 2 == 0:
-        raise ValueError("Window length ({}) is even. Please check the window input variable. Only odd-length windows "
-                         "are accepted, so that the result of the sliding "
-                         "window analysis centres around a single non-ambiguous original position.".format(
-            window_length))
+    Parameters
+    ----------
+    data_df : pd.DataFrame
+        Dataframe with one data series per column.
+    window : list or string
+        The user-defined window. See calculate_weighted_windows.
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. See calculate_weighted_windows.
+    columns : list or string
+        List of column names to be analysed, or "all" (default) for all numeric columns.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+    progress : boolean or function
+        Progress report during the calculation. See calculate_weighted_windows.
+    workers : int
+        Number of threads used for the calculation. See calculate_weighted_windows.
+    dtype : string or np.dtype
+        Float type of the calculation and output, "float64" (default) or "float32". See calculate_weighted_windows.
+    out : np.ndarray
+        Optional preallocated float array or np.memmap of shape (len(data_df), number of columns), into which the
+        output is written. See calculate_weighted_windows.
 
-    elif window_length > 100:
-        raise ValueError("Window length ({}) is too long. Weighslide has not been optimised for large windows "
-                         "or datasets. To run code anyway, convert this elif statement to a comment.".format(window_length))
+    Returns
+    -------
+    output_df : pd.DataFrame
+        Output data, with the index of data_df and one column for each analysed column.
+    """
+    if columns == "all":
+        columns = list(data_df.select_dtypes(include="number").columns)
+    elif type(columns) != list:
+        raise TypeError("The input variable 'columns' is neither a list nor 'all'.")
+    if len(columns) == 0:
+        raise ValueError("No columns found for analysis. Please check the 'columns' input variable.")
 
-    # count the number of positions on either side of the central position
-    extension_each_side = int((window_length - 1) / 2)
-    # extend the original series with zeroes on either side
-    # define positive and negative ranges
-    neg_range = list(range(-extension_each_side, 0))
-    pos_range = list(np.arange(1, 6) + len(data_series) - 1)
-    # create the index (e.g. -5,-4,-3,-2,-1,0,ORIG DATA, end+1, end+2...end+5)
-    s_index = neg_range + list(data_series.index) + pos_range
-    # reindex the series so that it is padded with np.nan on either side, as in the s_index
-    extend_series = data_series.reindex(s_index)
-
-    # create output series for the final window-averaged data
-    output_series = pd.Series(index=data_series.index, dtype=float)
-    # create output dataframes for saving all the slices etc.
-    df_orig_sliced = pd.DataFrame()
-    df_multiplied = pd.DataFrame()
-
-    # get length of data series
-    data_series_len = len(data_series)
-
-    # show a warning if the data series is quite long
-    if data_series_len > 1000:
-        print("Warning. Input data length is {}. Weighslide performance may be slow.".format(data_series_len))
-        if data_series_len > 10000:
-            # abort if data series is very long.
-            raise ValueError("Program aborted due to long input sequence. "
-                             "Weighslide performance has not been optimised for large datasets. "
-                             "To run code anyway, convert this 'if statement' to a comment".format(data_series_len))
-
-    # for i in extend_series.index[:len(extend_series)-extension_each_side-1]:
-    for i in range(data_series_len):
-        if data_series_len > 100:
-            if i % 100 == 0:
-                sys.stdout.write(".")
-                sys.stdout.flush()
-        start = extend_series.index[i]
-        end = start + window_length
-        data_range = list(range(start, end))
-        # slice out the original data from the window (e.g. 11 residues)
-        # orig_sliced = extend_series.loc[i:i+window_length-1]
-        # orig_sliced = extend_series[extend_series.index.isin(data_range)]
-        orig_sliced = extend_series.reindex(data_range)
-        orig_sliced.name = "window {}".format(i)
-        orig_sliced_for_excel = orig_sliced.fillna("nodata")
-        df_orig_sliced = pd.concat([df_orig_sliced, orig_sliced_for_excel], axis=1, names=[start])
-        # double-check that the sliced window, and the values have the same length
-        assert (len(orig_sliced) == len(window_array))
-        # multiply by the window value multiplier for each position
-        win_multiplied = orig_sliced * window_array
-        win_multiplied_for_excel = win_multiplied.fillna("")
-        df_multiplied = pd.concat([df_multiplied, win_multiplied_for_excel], axis=1, names=start)
-        if statistic == "mean":
-            # calculate the mean of the values, representing the relative value of that window
-            win_mult_statistic = win_multiplied.mean()
-        elif statistic == "std":
-            # calculate the standard deviation of the values, representing the relative value of that window
-            win_mult_statistic = win_multiplied.std()
-        elif statistic == "sum":
-            # calculate the standard deviation of the values, representing the relative value of that window
-            win_mult_statistic = win_multiplied.sum()
-        else:
-            raise ValueError("The 'statistic' variable is not recognised. \nPlease check that the variable "
-                             "is either 'mean', 'std', or 'sum'.")
-        # add to output series
-        output_series[i] = win_mult_statistic
+    window = compile_window(window)
+    # raise a ValueError if the statistic is not recognised
+    _get_quantile(statistic)
 
-    output_series.index.name = "position"
-    output_series.name = "{} over window".format(statistic)
+    dtype = _get_output_dtype(dtype, out, (len(data_df), len(columns)))
+    # 2D array with one data series per column
+    data_array = data_df[columns].to_numpy(dtype=dtype)
 
-    if full_output == True:
-        return window_array, df_orig_sliced, df_multiplied, output_series
-    else:
-        return output_series
-
-
-# create a parser object to read user inputs from the command line
-parser = argparse.ArgumentParser()
-
-# add command-line options
-parser.add_argument("w",  # "--window",
-                    help="Sliding weighted window. Can be either a python list "
-                         "(e.g. [0.3,1.0,0.3,0,0.3,1.0,0.3,0,0.3,1.0,0.3]), or a list of numbers that will be "
-                         "converted to a python list (e.g. 393x393x393), where x represents positions that are ignored"
-                         "and 9 represents positions that are most highly weighted.")
-parser.add_argument("s",  # "--statistic",
-                    default="mean",
-                    type=str, choices=["mean", "std", "sum"],
-                    help="The choices are mean, std or sum. Desired method to reduce the weighted values in the to a "
-                         "single value at the central position.")
-parser.add_argument("-r",  # "--rawdata",
-                    default=None,
-                    help='Raw data input in the command line. Should be a python list of integers (e.g. "[1,3,5,7,2,4]")'
-                         ' or floats (e.g. "[1.1,3.4,5.2,7.8,2.7,4.5]")')
-parser.add_argument("-i",  # "-infile",
-                    default=None,
-                    help=r'Full path of file containing original data in csv or excel format.'
-                         r'E.g. "C:/Path/to/your/file.xlsx"')
-parser.add_argument("-n",  # "--name",
-                    default="",
-                    help="Name of dataset. Should not be longer than 20 characters. Used in output filenames.")
-parser.add_argument("-c",  # "--column",
-                    default=None,
-                    help='Column name in input file that should be used for analysis. E.g. "data values"')
-parser.add_argument("-o",  # "--overwrite",
-                    type=str, default="False",
-                    help='If True, existing files will be overwritten.')
-parser.add_argument("-e",  # "--excel_kwargs",
-                    default="None",
-                    help="Keyword arguments in python dictionary format to be used when opening "
-                         "an excel file using the python pandas module. (E.g. {'sheet_name':'orig_data'}")
-parser.add_argument("-k",  # "--csv_kwargs",
-                    default=None,
-                    help="Keyword arguments in python dictionary format to be used when opening "
-                         "your csv file using the python pandas module. (E.g. {'delimeter':',','header'='infer'}")
+    if engine == "auto":
+        engine = _choose_engine(len(data_array), len(window), statistic)
 
-# if weighslide.py is run as the main python script, obtain the options from the command line.
-if __name__ == '__main__':
+    if engine not in ["direct", "fft", "numba"]:
+        raise ValueError("The 'engine' variable is not recognised. \nPlease check that the variable "
+                         "is either 'direct', 'fft', 'numba', or 'auto'.")
 
-    print("\nTo view the help:\npython weighslide.py -h\n\nTo test the weighslide module:\n"
-          "python weighslide.py [0.5,1.0,0.5] mean -r [1,3,5,7,2,4,3,5,7,2,4]\n\n")
-    # obtain command-line arguments
-    args = parser.parse_args()
+    if workers is not None and workers > 1:
+        output_array = _calculate_weighted_windows_parallel(data_array, window, statistic, engine, workers,
+                                                            _get_progress_function(progress), out=out)
+    elif engine == "direct":
+        output_array = _calculate_weighted_windows_direct(data_array, window, statistic,
+                                                          _get_progress_function(progress), out=out)
+    elif engine == "fft":
+        output_array = _calculate_weighted_windows_fft(data_array, window, statistic,
+                                                       _get_progress_function(progress), out=out)
+    elif engine == "numba":
+        output_array = _calculate_weighted_windows_numba(data_array, window, statistic,
+                                                         _get_progress_function(progress), out=out)
 
-    print(args)
+    output_df = pd.DataFrame(output_array, index=data_df.index, columns=columns, copy=False)
+    output_df.index.name = "position"
+    return output_df
 
-    # extract the boolean "overwrite" variable from the input arguments
-    if "o" in args:
-        print(args.o)
-        if args.o in ["True", "true", "TRUE"]:
-            overwrite = True
-        elif args.o in ["False", "false", "FALSE"]:
-            overwrite = False
+
+def calculate_weighted_windows_grouped(data_df, window, statistic, group_column, column=None, engine="auto",
+                                       progress=True):
+    """ Apply the weighslide algorithm to many data series that are stacked in one table, in a single calculation.
+
+    The table contains a column with the ID of each series (e.g. a protein or trace name). The windows never cross the
+    boundaries between series. The rows are sorted by ID (keeping the order within each series), and the series are
+    joined in a single array, separated by (window_length - 1) / 2 np.nan values. Each series is therefore padded
+    with np.nan at both ends, exactly as in calculate_weighted_windows, and all series are processed in one pass.
+    The rows of a series do not need to be adjacent in the table.
+
+    Parameters
+    ----------
+    data_df : pd.DataFrame
+        Dataframe with a data column and an ID column.
+    window : list or string
+        The user-defined window. See calculate_weighted_windows.
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. See calculate_weighted_windows.
+    group_column : string
+        Name of the column with the ID of each series.
+    column : string
+        Name of the data column. If None (default), the table must contain a single numeric column other than the
+        group_column.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+    progress : boolean or function
+        Progress report during the calculation. See calculate_weighted_windows.
+
+    Returns
+    -------
+    output_series : pd.Series
+        Output data, with the index and row order of data_df. Each value is identical to the output of
+        calculate_weighted_windows for the series containing that row (within FFT rounding for the "fft" engine).
+    """
+    if column is None:
+        columns = [c for c in data_df.select_dtypes(include="number").columns if c != group_column]
+        if len(columns) != 1:
+            raise ValueError("No column name provided. The input table has {} numeric data columns, and therefore "
+                             "the column name with data needs to be input as a column variable.".format(len(columns)))
+        column = columns[0]
+
+    window = compile_window(window)
+    # raise a ValueError if the statistic is not recognised
+    _get_quantile(statistic)
+
+    # integer code of the series of each row
+    codes = pd.factorize(data_df[group_column])[0]
+    if np.any(codes < 0):
+        raise ValueError("The group column '{}' contains missing values. Please check that each row has an "
+                         "ID.".format(group_column))
+    # sort the rows by series, keeping the original order within each series
+    order = np.argsort(codes, kind="stable")
+    data_array = data_df[column].to_numpy(dtype=float)[order]
+
+    # each series is shifted to the right by (window_length - 1) / 2 positions for each preceding series, leaving a
+    # gap of np.nan between series that is as wide as the padding on each side of a slice
+    extension_each_side = window.extension_each_side
+    sorted_codes = codes[order]
+    series_number = np.cumsum(np.diff(sorted_codes, prepend=sorted_codes[:1]) != 0)
+    joined_positions = np.arange(len(data_array)) + extension_each_side * series_number
+    joined_array = np.full(len(data_array) + extension_each_side * series_number.max(initial=0), np.nan)
+    joined_array[joined_positions] = data_array
+
+    if engine == "auto":
+        engine = _choose_engine(len(joined_array), len(window), statistic)
+
+    if engine == "direct":
+        joined_output = _calculate_weighted_windows_direct(joined_array, window, statistic,
+                                                           _get_progress_function(progress))
+    elif engine == "fft":
+        joined_output = _calculate_weighted_windows_fft(joined_array, window, statistic,
+                                                        _get_progress_function(progress))
+    elif engine == "numba":
+        joined_output = _calculate_weighted_windows_numba(joined_array, window, statistic,
+                                                          _get_progress_function(progress))
+    else:
+        raise ValueError("The 'engine' variable is not recognised. \nPlease check that the variable "
+                         "is either 'direct', 'fft', 'numba', or 'auto'.")
+
+    # return the output to the original row order
+    output_array = np.empty(len(data_array), dtype=float)
+    output_array[order] = joined_output[joined_positions]
+
+    output_series = pd.Series(output_array, index=data_df.index, dtype=float)
+    output_series.index.name = "position"
+    output_series.name = "{} over window".format(statistic)
+    return output_series
+
+
+def calculate_weighted_windows_2d(data_matrix, window, statistic, engine="auto", progress=True):
+    """ Apply a 2D weighted window to a matrix, such as a residue contact map.
+
+    The matrix is padded with np.nan on all sides, so that every position is the centre of a 2D slice. Each slice is
+    multiplied by the 2D window, and the statistic is applied to all weighted values of the slice, ignoring NaN.
+
+    Parameters
+    ----------
+    data_matrix : pd.DataFrame or np.ndarray
+        2D array of input data.
+    window : list or string
+        The user-defined 2D window, with an odd number of rows and columns. Can be a multi-line string, with one row
+        of the window per line, using the same encoding as calculate_weighted_windows (e.g. "494\n9x9\n494", where
+        "x" positions are ignored). Can also be a list of rows, each of which is a list of numbers or "x"
+        (e.g. [[1, 2, 1], [2, "x", 2], [1, 2, 1]]).
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. The options are "mean", "std", or "sum".
+    engine : string
+        Algorithm used for the calculation. The options are "direct", "fft", or "auto".
+        "direct" adds the weighted values for each position of the window to the output, and is fast for small
+        windows. The standard deviation is calculated in two passes, as in numpy.
+        "fft" uses 2D convolution, and is much faster for large windows. Results agree with "direct" within floating
+        point rounding.
+        "auto" (default) uses "fft" for windows with at least 32 positions, and "direct" otherwise.
+    progress : boolean or function
+        Progress report during the calculation. See calculate_weighted_windows.
+
+    Returns
+    -------
+    output_df : pd.DataFrame
+        Output data of the same shape as data_matrix, with the index and columns of data_matrix if it is a dataframe.
+    """
+    window_array = _parse_window_2d(window)
+    if statistic not in ["mean", "std", "sum"]:
+        raise ValueError("The 'statistic' variable is not recognised for 2D windows. \nPlease check that the "
+                         "variable is either 'mean', 'std', or 'sum'.")
+
+    data_array = np.asarray(data_matrix, dtype=float)
+    if data_array.ndim != 2:
+        raise ValueError("The input variable 'data_matrix' should be a 2D array or dataframe.")
+
+    if engine == "auto":
+        # the numba engine is only available for 1D windows
+        engine = "fft" if _choose_engine(data_array.size, window_array.size) == "fft" else "direct"
+
+    if engine == "direct":
+        output_array = _calculate_weighted_windows_2d_direct(data_array, window_array, statistic,
+                                                             _get_progress_function(progress))
+    elif engine == "fft":
+        output_array = _calculate_weighted_windows_2d_fft(data_array, window_array, statistic,
+                                                          _get_progress_function(progress))
+    else:
+        raise ValueError("The 'engine' variable is not recognised. \nPlease check that the variable "
+                         "is either 'direct', 'fft', or 'auto'.")
+
+    if isinstance(data_matrix, pd.DataFrame):
+        return pd.DataFrame(output_array, index=data_matrix.index, columns=data_matrix.columns)
+    return pd.DataFrame(output_array)
+
+
+def calculate_weighted_windows_bank(data_series, windows, statistic):
+    """ Apply many windows to the same input series in a single pass.
+
+    The windows may have different (odd) lengths. All windows are centred and padded with ignored positions to the
+    length of the longest window, and combined into a 2D matrix of weights. The data is padded and sliced once,
+    and the weighted sums for all windows are calculated by matrix multiplication of the slices with the weights.
+    The mean and std are calculated from the number of values, and the first and second moments, as in the "fft"
+    engine of calculate_weighted_windows. For the std, the moments are calculated for the data minus its mean, so that
+    data with a large offset does not lose precision. Results agree with calculate_weighted_windows within floating
+    point rounding (for the std, typically <1e-9 relative, unless the std of a slice is very small compared to the
+    spread of the data around its mean).
+    Order statistics (median, min, max and quantiles), and data with infinite values, are calculated separately for
+    each window.
+
+    Parameters
+    ----------
+    data_series : pd.Series
+        1D array of input data to which the weighslide algorithm will be applied.
+    windows : list
+        List of windows, each of which is a list or string. See calculate_weighted_windows.
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. See calculate_weighted_windows.
+
+    Returns
+    -------
+    output_df : pd.DataFrame
+        Output data, with the index of data_series and one column for each window. Column names are the windows
+        in string format.
+    """
+    if type(windows) != list or len(windows) == 0:
+        raise TypeError("The input variable 'windows' should be a non-empty list of windows.")
+    # raise a ValueError if the statistic is not recognised
+    _get_quantile(statistic)
+
+    compiled_windows = [compile_window(window) for window in windows]
+    columns = [window if type(window) == str else str(window) for window in windows]
+    data_array = data_series.to_numpy(dtype=float)
+
+    # order statistics cannot be calculated by matrix multiplication, and each window is applied separately. Infinite
+    # values would give NaN in the matrix multiplication (inf * 0 for the ignored positions), so that data with
+    # infinite values is also calculated separately for each window.
+    if _get_quantile(statistic) is not None or np.isinf(data_array).any():
+        output_array = np.column_stack([_calculate_weighted_windows_direct(data_array, window, statistic)
+                                        for window in compiled_windows])
+        output_df = pd.DataFrame(output_array, index=data_series.index, columns=columns)
+        output_df.index.name = "position"
+        return output_df
+
+    max_window_length = max(len(window) for window in compiled_windows)
+
+    # matrix of weights with shape (max_window_length, n_windows). NaN ("x") and padded positions have a weight of 0,
+    # and are excluded from the valid matrix used to count the values in each slice.
+    weight_matrix = np.zeros((max_window_length, len(windows)))
+    valid_matrix = np.zeros((max_window_length, len(windows)))
+    weight_matrix_sq = np.zeros((max_window_length, len(windows)))
+    # for the std, a matrix with the positions of each weight of each window, for the exact spread of the weights.
+    # Windows with many different weights have no columns, and their spread is calculated from weight_matrix_sq.
+    weight_columns = []
+    weight_positions = []
+    for n, window in enumerate(compiled_windows):
+        padding = int((max_window_length - len(window)) / 2)
+        weight_matrix[padding:padding + len(window), n] = window.window_zeroed
+        weight_matrix_sq[padding:padding + len(window), n] = window.window_zeroed_sq
+        valid_matrix[padding:padding + len(window), n] = window.count_kernel
+        if len(window.unique_weights) <= _MAX_UNIQUE_WEIGHTS:
+            weight_columns.append(slice(len(weight_positions), len(weight_positions) + len(window.unique_weights)))
+            for weight in window.unique_weights:
+                position_column = np.zeros(max_window_length)
+                position_column[padding:padding + len(window)] = window.window_array == weight
+                weight_positions.append(position_column)
+        else:
+            weight_columns.append(None)
+    weight_position_matrix = np.zeros((max_window_length, 0)) if len(weight_positions) == 0 \
+        else np.column_stack(weight_positions)
+
+    data_series_len = len(data_array)
+    padded_array = _pad_data(data_array, max_window_length)
+    data_valid = ~np.isnan(padded_array)
+    if statistic == "std":
+        # deviations from the mean of the data, with 0 for missing values
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            offset = np.nan_to_num(np.nanmean(padded_array))
+        padded_array = padded_array - offset
+    # views of all slices, with shape (data_series_len, max_window_length). No data is copied.
+    sliced_view = sliding_window_view(np.where(data_valid, padded_array, 0.0), max_window_length)
+    valid_view = sliding_window_view(data_valid.astype(float), max_window_length)
+
+    output_array = np.empty((data_series_len, len(windows)))
+    block_size = max(1, _BLOCK_ELEMENTS // max_window_length)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for start in range(0, data_series_len, block_size):
+            end = min(start + block_size, data_series_len)
+            slices = sliced_view[start:end]
+            count = valid_view[start:end] @ valid_matrix
+            weighted_sum = slices @ weight_matrix
+            if statistic == "sum":
+                output_array[start:end] = weighted_sum
+            elif statistic == "mean":
+                output_array[start:end] = np.where(count > 0, weighted_sum / count, np.nan)
+            elif statistic == "std":
+                # sum of squared deviations of the weighted values from their mean, for the centred data
+                sum_sq_dev = (slices ** 2) @ weight_matrix_sq - weighted_sum ** 2 / count
+                # the weighted offsets (weight * offset) differ between positions, and add to the spread
+                weight_sum = valid_view[start:end] @ weight_matrix
+                centred_cross = slices @ weight_matrix_sq
+                weight_counts = valid_view[start:end] @ weight_position_matrix
+                weight_spread = np.empty_like(weighted_sum)
+                for n, window in enumerate(compiled_windows):
+                    if weight_columns[n] is None:
+                        weight_spread[:, n] = count[:, n] * (valid_view[start:end] @ weight_matrix_sq[:, n]) \
+                                              - weight_sum[:, n] ** 2
+                    else:
+                        counts = weight_counts[:, weight_columns[n]]
+                        weight_spread[:, n] = _get_weight_spread(list(counts.T), window.unique_weights)[1]
+                sum_sq_dev += (2 * offset * (centred_cross - weighted_sum * weight_sum / count)
+                               + offset ** 2 * weight_spread / count)
+                variance = sum_sq_dev / (count - 1)
+                # negative variance can only be caused by rounding errors
+                output_array[start:end] = np.where(count > 1, np.sqrt(np.clip(variance, 0.0, None)), np.nan)
+
+    output_df = pd.DataFrame(output_array, index=data_series.index, columns=columns)
+    output_df.index.name = "position"
+    return output_df
+
+
+def calculate_weighslide_result(data_series, window, statistic, engine="auto", cache=None, progress=True,
+                                metrics=None, workers=None, dtype="float64", out=None):
+    """ Apply the weighslide algorithm to an input series, and return a WeighslideResult.
+
+    Only the output_series is calculated. The slices and multiplied slices are created by the WeighslideResult
+    when they are accessed, so that they cost nothing if they are not needed.
+
+    Parameters
+    ----------
+    data_series : pd.Series
+        1D array of input data to which the weighslide algorithm will be applied.
+    window : list or string
+        The user-defined window. See calculate_weighted_windows.
+    statistic : string
+        Statistical algorithm to be applied to the weighted slice. See calculate_weighted_windows.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+    cache : ResultCache, Path or string
+        Optional cache of previous results, or the directory of the cache. If the same data has been analysed with
+        the same window, statistic and engine, the output is loaded from the cache instead of being recalculated.
+    progress : boolean or function
+        Progress report during the calculation. See calculate_weighted_windows.
+    metrics : WeighslideMetrics
+        If given, the duration of the "window" and "compute" stages are added to the metrics.
+    workers : int
+        Number of threads used for the calculation. See calculate_weighted_windows.
+    dtype : string or np.dtype
+        Float type of the calculation and output, "float64" (default) or "float32". See calculate_weighted_windows.
+    out : np.ndarray
+        Optional preallocated float array or np.memmap for the output. See calculate_weighted_windows.
+
+    Returns
+    -------
+    result : WeighslideResult
+    """
+    if metrics is None:
+        metrics = WeighslideMetrics()
+
+    data_series.name = "original data"
+
+    # convert the user input window to a numpy array of weights, with np.nan for ignored positions
+    with metrics.stage("window") as stage:
+        window = compile_window(window)
+        window_array = window.window_array
+        stage["bytes"] = window_array.nbytes
+
+    # raise a ValueError if the statistic is not recognised
+    _get_quantile(statistic)
+
+    dtype = _get_output_dtype(dtype, out, (len(data_series),))
+    # convert the input data to a float array. Positional values are used, the original index is kept for the output.
+    data_array = data_series.to_numpy(dtype=dtype)
+
+    if engine == "auto":
+        engine = _choose_engine(len(data_array), len(window_array), statistic)
+
+    if engine not in ["direct", "fft", "numba"]:
+        raise ValueError("The 'engine' variable is not recognised. \nPlease check that the variable "
+                         "is either 'direct', 'fft', 'numba', or 'auto'.")
+
+    with metrics.stage("compute") as stage:
+        # look up the output in the cache
+        output_array = None
+        if cache is not None:
+            if not isinstance(cache, ResultCache):
+                cache = ResultCache(cache)
+            cache_key = ResultCache.get_key(data_array, window_array, statistic, engine)
+            output_array = cache.get(cache_key)
+            if output_array is not None and out is not None:
+                out[...] = output_array
+                output_array = out
+
+        # apply the window and statistic to all slices of the data
+        if output_array is None:
+            if workers is not None and workers > 1:
+                output_array = _calculate_weighted_windows_parallel(data_array, window, statistic, engine,
+                                                                    workers, _get_progress_function(progress), out=out)
+            elif engine == "direct":
+                output_array = _calculate_weighted_windows_direct(data_array, window, statistic,
+                                                                  _get_progress_function(progress), out=out)
+            elif engine == "fft":
+                output_array = _calculate_weighted_windows_fft(data_array, window, statistic,
+                                                               _get_progress_function(progress), out=out)
+            elif engine == "numba":
+                output_array = _calculate_weighted_windows_numba(data_array, window, statistic,
+                                                                 _get_progress_function(progress), out=out)
+            if cache is not None:
+                cache.put(cache_key, output_array)
+        stage["bytes"] = output_array.nbytes
+
+    # create output series for the final window-averaged data, without copying the output array
+    output_series = pd.Series(output_array, index=data_series.index, copy=False)
+    output_series.index.name = "position"
+    output_series.name = "{} over window".format(statistic)
+
+    return WeighslideResult(data_array, window_array, statistic, output_series)
+
+
+class WeighslideMetrics:
+    """ Duration and size of each stage of a weighslide analysis.
+
+    Each stage is recorded as a dictionary with the keys "stage", "seconds" and "bytes". The bytes are the size of the
+    file that was read or written, or of the array that was created.
+
+    Parameters
+    ----------
+    hook : function
+        If given, called as hook(stage, seconds, bytes) at the end of each stage.
+    """
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """ Measure the duration of a stage. The bytes can be set in the yielded dictionary."""
+        record = {"stage": name, "seconds": 0.0, "bytes": 0}
+        start = time.perf_counter()
+        yield record
+        self.add(name, time.perf_counter() - start, record["bytes"])
+
+    def add(self, name, seconds, nbytes):
+        """ Add a stage that was measured elsewhere, e.g. in another thread."""
+        self.stages.append({"stage": name, "seconds": seconds, "bytes": nbytes})
+        if self.hook is not None:
+            self.hook(name, seconds, nbytes)
+
+    @property
+    def total_seconds(self):
+        return sum(record["seconds"] for record in self.stages)
+
+    def to_dataframe(self):
+        """ Get the stages as a dataframe, with the columns "stage", "seconds" and "bytes"."""
+        return pd.DataFrame(self.stages, columns=["stage", "seconds", "bytes"])
+
+    def __repr__(self):
+        stages = ", ".join("{}={:.3f}s".format(record["stage"], record["seconds"]) for record in self.stages)
+        return "WeighslideMetrics({})".format(stages)
+
+
+class ResultCache:
+    """ On-disk cache of weighslide output arrays, with a size limit and least-recently-used eviction.
+
+    Each output array is saved as an npy file in the cache directory. The filename is a hash of the input data,
+    the window_array, the statistic, the engine and the dtype, so that any change to the input gives a different file.
+    Loading or saving a file updates its modification time. If the total size of the cache exceeds max_bytes,
+    the files that were least recently used are deleted.
+
+    Parameters
+    ----------
+    directory : Path or string
+        Directory of the cache. Created if it does not exist.
+    max_bytes : int
+        Maximum total size of the cached files. The default is 1 GB.
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def get_key(data_array, window_array, statistic, engine):
+        """ Get the hash of the input data and parameters, used as the filename in the cache."""
+        hasher = hashlib.blake2b(digest_size=20)
+        hasher.update("{}|{}|{}|{}|".format(statistic, engine, data_array.shape, data_array.dtype).encode())
+        hasher.update(np.ascontiguousarray(window_array, dtype=float).tobytes())
+        hasher.update(np.ascontiguousarray(data_array).tobytes())
+        return hasher.hexdigest()
+
+    def get(self, key):
+        """ Load an output array from the cache. Returns None if the key is not in the cache."""
+        path = self.directory / (key + ".npy")
+        try:
+            output_array = np.load(path)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        # mark the file as recently used
+        os.utime(path)
+        return output_array
+
+    def put(self, key, output_array):
+        """ Save an output array to the cache, and delete the least recently used files if the cache is full."""
+        path = self.directory / (key + ".npy")
+        # save to a temporary file first, so that an interrupted write never leaves an incomplete file in the cache
+        _write_atomic(path, lambda temp_path: np.save(temp_path, output_array))
+        self.evict()
+
+    def evict(self):
+        """ Delete the least recently used files, until the total size is below max_bytes."""
+        files = [(path.stat().st_mtime, path.stat().st_size, path) for path in self.directory.glob("*.npy")
+                 if not path.name.endswith(".tmp.npy")]
+        total_bytes = sum(size for mtime, size, path in files)
+        for mtime, size, path in sorted(files, key=lambda item: item[0]):
+            if total_bytes <= self.max_bytes:
+                break
+            path.unlink()
+            total_bytes -= size
+
+
+class WeighslideResult:
+    """ Output of the weighslide algorithm, with lazily created slices for double-checking the calculation.
+
+    Attributes
+    ----------
+    window_array : np.ndarray
+        The window in numpy array format, as it is applied to the input data slices.
+    statistic : string
+        The statistic applied to the weighted slices.
+    output_series : pd.Series
+        The result after slicing, applying the window, and applying the statistic.
+
+    Properties (created when first accessed)
+    ----------
+    sliced_array : np.ndarray
+        Float array of shape (data length, window length), with one slice of the NaN-padded original data per row.
+        This is a read-only view of the padded data, and does not copy it.
+    multiplied_array : np.ndarray
+        Float array of shape (data length, window length), containing the slices multiplied by the window_array.
+    df_orig_sliced : pd.DataFrame
+        Slices of the original data, in the layout of calculate_weighted_windows.
+    df_multiplied : pd.DataFrame
+        Slices after multiplication with the window_array, in the layout of calculate_weighted_windows.
+    """
+
+    def __init__(self, data_array, window_array, statistic, output_series):
+        self.data_array = data_array
+        self.window_array = window_array
+        self.statistic = statistic
+        self.output_series = output_series
+        self._multiplied_array = None
+        self._df_orig_sliced = None
+        self._df_multiplied = None
+
+    @property
+    def sliced_array(self):
+        if len(self.data_array) == 0:
+            return np.empty((0, len(self.window_array)), dtype=self.data_array.dtype)
+        padded_array = _pad_data(self.data_array, len(self.window_array))
+        return sliding_window_view(padded_array, len(self.window_array))
+
+    @property
+    def multiplied_array(self):
+        if self._multiplied_array is None:
+            self._multiplied_array = self.sliced_array * self.window_array.astype(self.data_array.dtype)
+        return self._multiplied_array
+
+    @property
+    def df_orig_sliced(self):
+        if self._df_orig_sliced is None:
+            self._df_orig_sliced = _get_band_dataframe(self.sliced_array, "nodata")
+        return self._df_orig_sliced
+
+    @property
+    def df_multiplied(self):
+        if self._df_multiplied is None:
+            self._df_multiplied = _get_band_dataframe(self.multiplied_array, "")
+        return self._df_multiplied
+
+
+class WeighslideStream:
+    """ Apply the weighslide algorithm to data that arrives in pieces, such as a live sensor feed.
+
+    The stream keeps the last window_length - 1 values in a buffer. Each call of update() adds new values, and returns
+    the output of every position whose slice is complete, i.e. every position with (window_length - 1) / 2 values
+    on the right side. The output of the last positions, whose slices are padded with np.nan as in
+    calculate_weighted_windows, is returned by flush(). The cost of an update depends on the number of new values
+    and the window length, but not on the number of values received before.
+
+    The concatenated output of update() and flush() is identical to the output of calculate_weighted_windows with
+    the "direct" engine, and agrees within floating point rounding with the "fft" engine.
+
+    Parameters
+    ----------
+    window : list, string or WeighslideWindow
+        The user-defined window. See calculate_weighted_windows.
+    statistic : string
+        Statistic applied to the weighted slices. See calculate_weighted_windows.
+    engine : string
+        Algorithm used for the calculation ("direct", "fft", "numba", or "auto"). See calculate_weighted_windows.
+        For "auto", the engine is selected from the window and statistic only, so that all updates use the same
+        engine.
+
+    Attributes
+    ----------
+    window_array : np.ndarray
+        The window in numpy array format, as it is applied to the data slices.
+    positions_received : int
+        Number of values added since the start of the data series.
+    positions_emitted : int
+        Number of output values returned since the start of the data series.
+    """
+
+    def __init__(self, window, statistic, engine="auto"):
+        self.window = compile_window(window)
+        self.window_array = self.window.window_array
+        # raise a ValueError if the statistic is not recognised
+        quantile = _get_quantile(statistic)
+        self.statistic = statistic
+
+        if engine == "auto":
+            engine = _choose_engine(np.inf, len(self.window_array), statistic)
+        if engine == "direct":
+            self._calculate = _calculate_weighted_windows_direct
+        elif engine == "fft" and quantile is None:
+            self._calculate = _calculate_weighted_windows_fft
+        elif engine == "numba":
+            self._calculate = _calculate_weighted_windows_numba
+        elif engine == "fft":
+            raise ValueError("The 'fft' engine cannot calculate the '{}' statistic. \nPlease use the 'direct' or "
+                             "'auto' engine for the median, min, max and quantiles.".format(statistic))
+        else:
+            raise ValueError("The 'engine' variable is not recognised. \nPlease check that the variable "
+                             "is either 'direct', 'fft', 'numba', or 'auto'.")
+        self.engine = engine
+        self.reset()
+
+    def reset(self):
+        """ Discard the buffered values, and start a new data series."""
+        extension_each_side = self.window.extension_each_side
+        # the start of the data series is padded with np.nan, as in calculate_weighted_windows
+        self._buffer = np.full(extension_each_side, np.nan)
+        self.positions_received = 0
+        self.positions_emitted = 0
+
+    def update(self, values):
+        """ Add one or more values, and return the output of the positions whose slices are now complete.
+
+        Parameters
+        ----------
+        values : float, list or np.ndarray
+            A single value, or a 1D sequence of values. Missing values should be np.nan.
+
+        Returns
+        -------
+        output_array : np.ndarray
+            1D float array with the output of the next positions. Empty if no slice was completed.
+        """
+        values = np.atleast_1d(np.asarray(values, dtype=float))
+        if values.ndim != 1:
+            raise ValueError("The input variable 'values' should be a single value or a 1D sequence of values.")
+        self.positions_received += len(values)
+        return self._calculate_complete(np.concatenate([self._buffer, values]))
+
+    def flush(self):
+        """ Return the output of the remaining positions, and reset the stream for a new data series.
+
+        Returns
+        -------
+        output_array : np.ndarray
+            1D float array with the output of the last (window_length - 1) / 2 positions, or fewer if fewer values
+            were received.
+        """
+        extension_each_side = self.window.extension_each_side
+        # the end of the data series is padded with np.nan
+        output_array = self._calculate_complete(np.concatenate([self._buffer, np.full(extension_each_side, np.nan)]))
+        self.reset()
+        return output_array
+
+    def _calculate_complete(self, buffer_array):
+        """ Calculate the output of all complete slices in the buffer, and keep the values needed for later slices."""
+        n_complete = len(buffer_array) - len(self.window_array) + 1
+        if n_complete <= 0:
+            self._buffer = buffer_array
+            return np.empty(0)
+        output_array = self._calculate(buffer_array, self.window, self.statistic, pad=False)
+        # copy the remaining values, so that the large buffer_array can be released
+        self._buffer = buffer_array[n_complete:].copy()
+        self.positions_emitted += n_complete
+        return output_array
+
+
+class WeighslideWindow:
+    """ A parsed window, with the constants used by the engines calculated in advance.
+
+    Parsing a window string or list takes longer than the calculation for a short data series. Use compile_window
+    to get a WeighslideWindow that is cached by value, so that each window is only parsed once, no matter how often
+    it is used. All functions and classes that accept a window (e.g. calculate_weighted_windows, WeighslideStream)
+    also accept a WeighslideWindow. The arrays of a WeighslideWindow are read-only, as they are shared by all users
+    of the cached window.
+
+    Parameters
+    ----------
+    window : list, string or np.ndarray
+        Window as a list (e.g. [2,"x",2]) or string (e.g. "4x4"), see calculate_weighted_windows, or a 1D float array
+        of weights, with np.nan for ignored positions.
+
+    Attributes
+    ----------
+    window_array : np.ndarray
+        1D float array of weights. Positions annotated with "x" are np.nan.
+    window_length : int
+        Number of positions in the window.
+    extension_each_side : int
+        Number of positions on either side of the central position.
+    window_valid : np.ndarray
+        Boolean array, True for the positions that are not "x".
+    positions : np.ndarray
+        Indices of the positions that are not "x".
+    weights : np.ndarray
+        Weights of the positions that are not "x".
+    window_zeroed : np.ndarray
+        Weights, with 0 for the positions that are "x". The kernel of the weighted sum in convolution.
+    window_zeroed_sq : np.ndarray
+        Squared weights, with 0 for the positions that are "x". The kernel of the weighted sum of squares.
+    count_kernel : np.ndarray
+        Float array with 1 for the positions that are not "x", and 0 otherwise. The kernel of the number of values.
+    valid_count : int
+        Number of positions that are not "x". This is the number of values in a slice without missing data.
+    unique_weights : np.ndarray
+        Sorted unique weights. Order statistics of windows with a single weight are calculated with sliding-window
+        algorithms.
+    runs : list
+        Start and length of each run of consecutive positions that are not "x".
+    """
+
+    def __init__(self, window):
+        if type(window) == str:
+            # determine length of the window from the user input window
+            window_length = len(window)
+            # split into a list, convert to float, divide by 10 to yield a proportion
+            window_series: pd.Series = pd.Series(list(window), dtype=object)
+            # replace x with np.nan
+            window_series = window_series.replace("x", np.nan)
+            # change dtype to float
+            window_series: pd.Series = window_series.astype(float)
+            # convert 0-9 scale to 1-10, divide by 10 to give a relative weighting
+            window_series = (window_series + 1) / 10
+            # convert the series to a numpy array
+            window_array = np.array(window_series).astype(float)
+
+        elif type(window) == list:
+            window_length = len(window)
+            # convert the list or series to a numpy array
+            window_series = pd.Series(window, dtype=object)
+            # replace x with np.nan
+            window_series = window_series.replace("x", np.nan)
+            # convert the series to a numpy array
+            window_array = np.array(window_series).astype(float)
+
+        elif isinstance(window, np.ndarray) and window.ndim == 1:
+            window_length = len(window)
+            window_array = np.array(window, dtype=float)
+
+        else:
+            raise TypeError("The input variable 'window' is neither a string nor a list.")
+
+        if window_length == 0:
+            raise ValueError("Window length is 0. Please check the 'window' input variable.")
+
+        elif window_length % 2 == 0:
+            raise ValueError("Window length ({}) is even. Please check the window input variable. Only odd-length "
+                             "windows are accepted, so that the result of the sliding "
+                             "window analysis centres around a single non-ambiguous original position.".format(
+                window_length))
+
+        window_array.setflags(write=False)
+        self.window_array = window_array
+        self.window_length = window_length
+        # count the number of positions on either side of the central position
+        self.extension_each_side = int((window_length - 1) / 2)
+        self.window_valid = ~np.isnan(window_array)
+        self.positions = np.flatnonzero(self.window_valid)
+        self.weights = window_array[self.positions]
+        self.window_zeroed = np.where(self.window_valid, window_array, 0.0)
+        self.window_zeroed_sq = self.window_zeroed ** 2
+        self.count_kernel = self.window_valid.astype(float)
+        self.valid_count = len(self.positions)
+        self.unique_weights = np.unique(self.weights)
+
+        # start and length of each run of consecutive positions in the window that are not "x"
+        edges = np.diff(np.concatenate([[0], self.window_valid.astype(int), [0]]))
+        self.runs = list(zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)))
+
+        for array in [self.window_valid, self.positions, self.weights, self.window_zeroed, self.window_zeroed_sq,
+                      self.count_kernel, self.unique_weights]:
+            array.setflags(write=False)
+
+    def __len__(self):
+        return self.window_length
+
+    def __repr__(self):
+        return "WeighslideWindow(length={}, positions={})".format(self.window_length, self.valid_count)
+
+
+def compile_window(window):
+    """ Get the WeighslideWindow of a window string or list, parsing the window only on first use.
+
+    Windows given as strings or lists are cached by value, so that repeated calls with an equal window return the
+    same WeighslideWindow. This removes the cost of parsing the window from every call of calculate_weighted_windows.
+
+    Parameters
+    ----------
+    window : list, string, np.ndarray or WeighslideWindow
+        The user-defined window. See calculate_weighted_windows. A WeighslideWindow is returned unchanged, and numpy
+        arrays of weights are compiled without caching.
+
+    Returns
+    -------
+    compiled_window : WeighslideWindow
+    """
+    if isinstance(window, WeighslideWindow):
+        return window
+    if type(window) == str:
+        return _compile_window_cached(window)
+    if type(window) == list:
+        try:
+            return _compile_window_cached(tuple(window))
+        except TypeError:
+            # lists with unhashable items cannot be cached, and are parsed (or rejected) without the cache
+            pass
+    return WeighslideWindow(window)
+
+
+@functools.lru_cache(maxsize=1024)
+def _compile_window_cached(window_key):
+    """ Create a WeighslideWindow from a window string, or a window list converted to a tuple."""
+    return WeighslideWindow(window_key if type(window_key) == str else list(window_key))
+
+
+def _get_progress_function(progress):
+    """ Convert the progress variable (True, False or a function) to a function, or None if progress is not shown."""
+    if progress is True:
+        return _print_progress_dot
+    elif progress is False or progress is None:
+        return None
+    return progress
+
+
+def _print_progress_dot(positions_done, positions_total):
+    """ Print a dot showing progress, for data series longer than 100 positions."""
+    if positions_total is None or positions_total > 100:
+        sys.stdout.write(".")
+        sys.stdout.flush()
+
+
+def _parse_window(window):
+    """ Convert the user-defined window to a numpy array of weights.
+
+    Parameters
+    ----------
+    window : list, string or WeighslideWindow
+        Window as a list (e.g. [2,"x",2]) or string (e.g. "4x4"). See calculate_weighted_windows.
+
+    Returns
+    -------
+    window_array : np.ndarray
+        Read-only 1D float array of weights. Positions annotated with "x" are np.nan.
+    """
+    return compile_window(window).window_array
+
+
+def _get_quantile(statistic):
+    """ Check that the statistic is recognised, and get the quantile of order statistics.
+
+    Parameters
+    ----------
+    statistic : string
+        "mean", "std", "sum", "median", "min", "max", or a quantile given as "q" followed by a percentage (e.g. "q90").
+
+    Returns
+    -------
+    quantile : float
+        The quantile between 0 and 1 for order statistics (e.g. 0.5 for "median", 0.0 for "min" and 0.9 for "q90"),
+        or None for "mean", "std" and "sum".
+    """
+    if statistic in ["mean", "std", "sum"]:
+        return None
+    order_statistics = {"median": 0.5, "min": 0.0, "max": 1.0}
+    if statistic in order_statistics:
+        return order_statistics[statistic]
+    if type(statistic) == str and statistic[:1] == "q":
+        try:
+            percentage = float(statistic[1:])
+        except ValueError:
+            percentage = np.nan
+        if 0 <= percentage <= 100:
+            return percentage / 100
+    raise ValueError("The 'statistic' variable is not recognised. \nPlease check that the variable "
+                     "is either 'mean', 'std', 'sum', 'median', 'min', 'max', or a quantile such as 'q90'.")
+
+
+def _get_statistic_argument(statistic):
+    """ Check the statistic given in the command line. Used as the argparse type."""
+    try:
+        _get_quantile(statistic)
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid choice: '{}' (choose from mean, std, sum, median, min, max, "
+                                         "or a quantile such as q90)".format(statistic))
+    return statistic
+
+
+def _get_output_dtype(dtype, out, shape):
+    """ Check the dtype and the optional output array, and return the dtype of the calculation.
+
+    If out is given, its dtype is used. Raises a ValueError for dtypes other than float64 and float32,
+    or if the shape of out does not match the output.
+    """
+    if out is not None:
+        if not isinstance(out, np.ndarray):
+            raise TypeError("The input variable 'out' should be a numpy array or memmap.")
+        if out.shape != shape:
+            raise ValueError("The shape of the 'out' array {} does not match the shape of the output {}.".format(
+                out.shape, shape))
+        dtype = out.dtype
+    dtype = np.dtype(dtype)
+    if dtype not in [np.float64, np.float32]:
+        raise ValueError("The 'dtype' variable is not recognised. \nPlease check that the variable "
+                         "is either 'float64' or 'float32'.")
+    return dtype
+
+
+def _parse_window_2d(window):
+    """ Convert the user-defined 2D window to a 2D numpy array of weights.
+
+    Parameters
+    ----------
+    window : list or string
+        Multi-line string (e.g. "494\n9x9\n494"), or list of rows (e.g. [[1, 2, 1], [2, "x", 2], [1, 2, 1]]).
+        See calculate_weighted_windows_2d.
+
+    Returns
+    -------
+    window_array : np.ndarray
+        2D float array of weights. Positions annotated with "x" are np.nan.
+    """
+    if type(window) == str:
+        # each non-empty line is a row of the window
+        rows = [row.strip() for row in window.strip().splitlines() if row.strip() != ""]
+    elif type(window) == list:
+        rows = [list(row) for row in window]
+    else:
+        raise TypeError("The input variable 'window' is neither a string nor a list.")
+
+    # each row is converted as a 1D window, which also checks that the row length is odd
+    row_arrays = [_parse_window(row) for row in rows]
+    if len(row_arrays) == 0:
+        raise ValueError("Window length is 0. Please check the 'window' input variable.")
+    if len(set(len(row_array) for row_array in row_arrays)) > 1:
+        raise ValueError("The rows of the 2D window have different lengths. Please check the 'window' input "
+                         "variable.")
+    if len(row_arrays) % 2 == 0:
+        raise ValueError("The number of rows of the 2D window ({}) is even. Only windows with an odd number of rows "
+                         "and columns are accepted, so that the result centres around a single non-ambiguous "
+                         "original position.".format(len(row_arrays)))
+    return np.array(row_arrays)
+
+
+def _pad_data(data_array, window_length):
+    """ Pad a float array with np.nan on either side of axis 0, so that every position is the centre of a full slice.
+
+    The padded array has the dtype of data_array (float64 or float32).
+    """
+    # count the number of positions on either side of the central position
+    extension_each_side = int((window_length - 1) / 2)
+    padded_array = np.full((len(data_array) + 2 * extension_each_side,) + data_array.shape[1:], np.nan,
+                           dtype=data_array.dtype)
+    padded_array[extension_each_side:extension_each_side + len(data_array)] = data_array
+    return padded_array
+
+
+def _calculate_weighted_windows_direct(data_array, window, statistic, progress=None, pad=True, out=None):
+    """ Vectorised weighslide engine, based on a strided (n, window_length) view of the padded data.
+
+    The view is created once without copying the data. The slices are multiplied by the window in blocks of
+    rows, so that memory use is bounded for long series and long windows. For windows with "x" positions, only the
+    positions that are not "x" are taken from the slices and multiplied.
+    NaN values (padding, missing data and "x" positions) are ignored, as in the pandas mean, std and sum.
+    The standard deviation uses ddof=1. Slices without any values give NaN for mean and std, and 0 for sum.
+    Order statistics (median, min, max and quantiles) are calculated by _calculate_weighted_windows_order.
+    The calculation uses the dtype of data_array, so float32 data is processed and returned as float32.
+
+    Parameters
+    ----------
+    data_array : np.ndarray
+        1D float array (float64 or float32) of input data, or 2D array with one data series per column.
+    window : WeighslideWindow or np.ndarray
+        Compiled window, or 1D float array of weights of odd length, with np.nan for ignored positions.
+    statistic : string
+        Statistic applied to the weighted slices. See calculate_weighted_windows.
+    progress : function
+        If given, called as progress(positions_done, positions_total) after each block of positions.
+    pad : boolean
+        If True (default), data_array is padded with np.nan, so that every position is the centre of a slice.
+        If False, data_array is already padded, and only the complete slices are calculated.
+    out : np.ndarray
+        If given, the output is written into this float array (or memmap) of the output shape, which is returned.
+
+    Returns
+    -------
+    output_array : np.ndarray
+        Float array of the same shape and dtype as data_array. If pad is False, the length is reduced by
+        window_length - 1.
+    """
+    quantile = _get_quantile(statistic)
+    if quantile is not None:
+        return _calculate_weighted_windows_order(data_array, window, quantile, progress, pad, out)
+
+    window = compile_window(window)
+    window_length = window.window_length
+    padded_array = _pad_data(data_array, window_length) if pad else data_array
+    data_series_len = len(padded_array) - window_length + 1
+    output_array = np.empty((data_series_len,) + data_array.shape[1:], dtype=padded_array.dtype) if out is None else out
+    # an empty data series gives an empty output
+    if data_series_len == 0:
+        return output_array
+
+    # view of all slices, with shape (data_series_len, window_length), or (data_series_len, n_columns, window_length)
+    # for 2D data. No data is copied.
+    sliced_view = sliding_window_view(padded_array, window_length, axis=0)
+    # number of positions processed together, keeping the temporary array of multiplied slices small
+    slice_length = window.valid_count if window.valid_count > 0 else window_length
+    block_size = max(1, _BLOCK_ELEMENTS // (slice_length * int(np.prod(data_array.shape[1:]))))
+
+    # nanmean and nanstd warn for slices that only contain NaN. The result (NaN) is the desired output.
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        for start in range(0, data_series_len, block_size):
+            end = min(start + block_size, data_series_len)
+            # multiply by the window value multiplier for each position
+            win_multiplied = _multiply_slices(sliced_view[start:end], window)
+            if statistic == "mean":
+                output_array[start:end] = np.nanmean(win_multiplied, axis=-1)
+            elif statistic == "std":
+                output_array[start:end] = np.nanstd(win_multiplied, axis=-1, ddof=1)
+            elif statistic == "sum":
+                output_array[start:end] = np.nansum(win_multiplied, axis=-1)
+            if progress is not None:
+                progress(end, data_series_len)
+
+    return output_array
+
+
+def _multiply_slices(sliced_block, window):
+    """ Multiply a block of slices by the window, in the dtype of the slices.
+
+    The positions that are "x" are left out, as they would only add NaN values that are ignored by the statistic.
+    The output has the shape of sliced_block, with the last axis reduced to window.valid_count positions. Windows
+    without any values are multiplied in full, so that every slice keeps at least one (NaN) value.
+
+    The output is always C-contiguous. The statistics add the values of each slice in an order that depends on the
+    memory layout, and the layout of a gathered view depends on the number of slices in the block. A fixed layout
+    keeps the result of each position independent of the block, parallel chunk or stream update it is calculated in.
+    """
+    # multiplication with a float64 window would convert float32 slices to float64
+    if window.valid_count in [0, window.window_length]:
+        multiplied = sliced_block * window.window_array.astype(sliced_block.dtype, copy=False)
+    else:
+        weights = window.weights.astype(sliced_block.dtype, copy=False)
+        multiplied = np.take(sliced_block, window.positions, axis=-1) * weights
+    return np.ascontiguousarray(multiplied)
+
+
+def _calculate_weighted_windows_order(data_array, window, quantile, progress=None, pad=True, out=None):
+    """ Weighslide engine for order statistics (median, min, max and quantiles) of the weighted slices.
+
+    If all positions of the window that are not "x" have the same weight, the weighted values are the data values
+    multiplied by a constant, and the sliding order statistic of the data can be scaled by the weight. The window is
+    then split into runs of consecutive positions. The min and max of each run are calculated with the monotonic
+    deque of pandas rolling windows, with a constant cost per position, and combined. Other quantiles are calculated
+    with the sorted skiplist of pandas rolling windows (cost log(window_length) per position), which requires a
+    window with a single run.
+
+    Other windows (different weights, or several runs for the median and quantiles) are processed in blocks of
+    multiplied slices, as in the direct engine. Each slice is sorted, and the quantile is interpolated between the
+    sorted values, which is much faster than np.nanquantile for slices containing NaN.
+
+    NaN values are ignored. Slices without any values give NaN.
+
+    Parameters
+    ----------
+    data_array : np.ndarray
+        1D float array of input data, or 2D array with one data series per column.
+    window : WeighslideWindow or np.ndarray
+        Compiled window, or 1D float array of weights of odd length, with np.nan for ignored positions.
+    quantile : float
+        Quantile between 0 (min) and 1 (max). Quantiles are linearly interpolated, as in pandas.
+    progress : function
+        If given, called as progress(positions_done, positions_total) during the calculation.
+    pad : boolean
+        If False, data_array is already padded. See _calculate_weighted_windows_direct.
+
+    Returns
+    -------
+    output_array : np.ndarray
+        Float array of the same shape as data_array. If pad is False, the length is reduced by window_length - 1.
+    """
+    window = compile_window(window)
+    window_length = window.window_length
+    padded_array = _pad_data(data_array, window_length) if pad else data_array
+    data_series_len = len(padded_array) - window_length + 1
+    output_shape = (data_series_len,) + data_array.shape[1:]
+    runs = window.runs
+    # an empty data series gives an empty output
+    if data_series_len == 0:
+        return np.empty(output_shape, dtype=padded_array.dtype) if out is None else out
+
+    if len(window.unique_weights) == 1 and (len(runs) == 1 or quantile in [0.0, 1.0]):
+        weight = window.unique_weights[0]
+        # multiplication with a negative weight reverses the order of the values
+        data_quantile = quantile if weight >= 0 else 1.0 - quantile
+        padded_df = pd.DataFrame(padded_array.reshape(len(padded_array), -1))
+        output_array = None
+        for start, length in runs:
+            rolling = padded_df.rolling(int(length), min_periods=1)
+            if data_quantile == 0.0:
+                rolled = rolling.min()
+            elif data_quantile == 1.0:
+                rolled = rolling.max()
+            else:
+                rolled = rolling.quantile(data_quantile)
+            # the rolling window ends at the last position of the run
+            run_array = rolled.to_numpy()[start + length - 1:start + length - 1 + data_series_len]
+            if output_array is None:
+                output_array = run_array
+            elif data_quantile == 0.0:
+                output_array = np.fmin(output_array, run_array)
+            else:
+                output_array = np.fmax(output_array, run_array)
+        # pandas rolling windows are calculated in float64, and are converted to the dtype of the data
+        if out is None:
+            out = np.empty(output_shape, dtype=padded_array.dtype)
+        out[...] = (output_array * weight).reshape(output_shape)
+        if progress is not None:
+            progress(data_series_len, data_series_len)
+        return out
+
+    sliced_view = sliding_window_view(padded_array, window_length, axis=0)
+    output_array = np.empty(output_shape, dtype=padded_array.dtype) if out is None else out
+    # number of values in each multiplied slice. See _multiply_slices.
+    slice_length = window.valid_count if window.valid_count > 0 else window_length
+    block_size = max(1, _BLOCK_ELEMENTS // (slice_length * int(np.prod(data_array.shape[1:]))))
+
+    for start in range(0, data_series_len, block_size):
+        end = min(start + block_size, data_series_len)
+        # NaN values are sorted to the end of each slice
+        win_sorted = np.sort(_multiply_slices(sliced_view[start:end], window), axis=-1)
+        count = np.sum(~np.isnan(win_sorted), axis=-1)
+        # position of the quantile between the sorted values, with linear interpolation as in pandas
+        position = quantile * np.maximum(count - 1, 0)
+        lower = np.floor(position).astype(int)
+        upper = np.minimum(lower + 1, np.maximum(count - 1, 0))
+        lower_value = np.take_along_axis(win_sorted, lower[..., np.newaxis], axis=-1)[..., 0]
+        upper_value = np.take_along_axis(win_sorted, upper[..., np.newaxis], axis=-1)[..., 0]
+        fraction = position - lower
+        block_output = np.where(fraction > 0, lower_value + (upper_value - lower_value) * fraction, lower_value)
+        block_output[count == 0] = np.nan
+        output_array[start:end] = block_output
+        if progress is not None:
+            progress(end, data_series_len)
+
+    return output_array
+
+
+def _get_fft_block(data_series_len, window_length):
+    """ Get the FFT length and the number of output positions per FFT block of _fft_correlate."""
+    # FFT length: a power of two, several times longer than the window, but no longer than required for the data
+    nfft_min = max(_FFT_BLOCK_MIN, 4 * window_length)
+    nfft_max = data_series_len + window_length - 1
+    nfft = 1 << int(np.ceil(np.log2(min(nfft_min, nfft_max))))
+    return nfft, nfft - window_length + 1
+
+
+def _fft_correlate(padded_array, kernel, data_series_len, nfft=None):
+    """ Correlate the padded data with a kernel along axis 0, using blocked FFTs (overlap-save).
+
+    Returns an array of length data_series_len, where position i is the sum of kernel * padded_array[i:i+len(kernel)].
+    2D padded arrays are correlated column by column. Neither input may contain NaN.
+    The FFT length (nfft) is chosen from the data_series_len, unless it is given.
+    """
+    window_length = len(kernel)
+    if nfft is None:
+        nfft = _get_fft_block(data_series_len, window_length)[0]
+    block_size = nfft - window_length + 1
+    # reverse the kernel, so that the convolution gives the sliding-window sum
+    kernel_fft = np.fft.rfft(kernel[::-1], nfft)
+    # broadcast the kernel over the columns of 2D data
+    kernel_fft = kernel_fft.reshape((-1,) + (1,) * (padded_array.ndim - 1))
+
+    output_array = np.empty((data_series_len,) + padded_array.shape[1:], dtype=float)
+    for start in range(0, data_series_len, block_size):
+        end = min(start + block_size, data_series_len)
+        segment = padded_array[start:end + window_length - 1]
+        convolved = np.fft.irfft(np.fft.rfft(segment, nfft, axis=0) * kernel_fft, nfft, axis=0)
+        # the first window_length - 1 values are affected by circular wrap-around, and are discarded
+        output_array[start:end] = convolved[window_length - 1:window_length - 1 + end - start]
+    return output_array
+
+
+def _get_fft_offset(padded_array):
+    """ Get the mean of the finite values of each data series (0 if there are none), used as the offset for std."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        return np.nan_to_num(np.nanmean(np.where(np.isfinite(padded_array), padded_array, np.nan), axis=0))
+
+
+def _get_fft_weight_spread(data_valid, window, data_series_len, nfft=None):
+    """ Get the sum of the weights, and the spread of the weights, of the valid values in each slice.
+
+    The spread is count * sum((weight - mean weight) ** 2). For windows with up to _MAX_UNIQUE_WEIGHTS different
+    weights, the number of valid values with each weight is counted exactly, and the spread is calculated by
+    _get_weight_spread. For other windows, the spread is calculated from the sums of the weights and squared weights.
+
+    Parameters
+    ----------
+    data_valid : np.ndarray
+        Boolean array, True for the values of the padded data that are not NaN.
+    window : WeighslideWindow
+        Compiled window.
+    data_series_len : int
+        Number of slices.
+    nfft : int
+        FFT length, as in _fft_correlate.
+
+    Returns
+    -------
+    weight_sum : np.ndarray
+        Sum of the weights of the valid values in each slice.
+    weight_spread : np.ndarray
+        Spread of the weights of the valid values in each slice.
+    """
+    data_valid = data_valid.astype(float)
+    if len(window.unique_weights) > _MAX_UNIQUE_WEIGHTS:
+        weight_sum = _fft_correlate(data_valid, window.window_zeroed, data_series_len, nfft)
+        weight_sum_sq = _fft_correlate(data_valid, window.window_zeroed_sq, data_series_len, nfft)
+        count = np.rint(_fft_correlate(data_valid, window.count_kernel, data_series_len, nfft))
+        return weight_sum, count * weight_sum_sq - weight_sum ** 2
+    weight_counts = [np.rint(_fft_correlate(data_valid, (window.window_array == weight).astype(float),
+                                            data_series_len, nfft)) for weight in window.unique_weights]
+    return _get_weight_spread(weight_counts, window.unique_weights)
+
+
+def _get_weight_spread(weight_counts, unique_weights):
+    """ Get the sum and spread of the weights in each slice, from the number of valid values with each weight.
+
+    The spread, count * sum((weight - mean weight) ** 2), is calculated from the pairs of weights,
+    sum(count_a * count_b * (weight_a - weight_b) ** 2). As the counts are exact, the spread is exactly 0 for slices
+    where all valid values have the same weight, and is never reduced by cancellation.
+
+    Parameters
+    ----------
+    weight_counts : list
+        Arrays with the number of valid values in each slice, for each of the unique_weights.
+    unique_weights : np.ndarray
+        The different weights of the window.
+
+    Returns
+    -------
+    weight_sum : np.ndarray
+        Sum of the weights of the valid values in each slice.
+    weight_spread : np.ndarray
+        Spread of the weights of the valid values in each slice.
+    """
+    weight_sum = np.zeros_like(weight_counts[0])
+    weight_spread = np.zeros_like(weight_counts[0])
+    for index_a, weight_a in enumerate(unique_weights):
+        weight_sum += weight_a * weight_counts[index_a]
+        for index_b in range(index_a):
+            weight_spread += weight_counts[index_a] * weight_counts[index_b] * (weight_a - unique_weights[index_b]) ** 2
+    return weight_sum, weight_spread
+
+
+def _calculate_weighted_windows_fft(data_array, window, statistic, progress=None, pad=True, nfft=None,
+                                    out=None, offset=None):
+    """ Convolution-based weighslide engine for long windows, with O(n log n) cost.
+
+    The weighted values are summed by FFT correlation of the data with the window. The NaN mask of the data is
+    correlated separately with the NaN mask of the window, so that the number of values in each slice is exact.
+    The standard deviation (ddof=1) is calculated from the first and second moments of the weighted values. To avoid
+    the cancellation of large moments for data with a constant offset, the moments are calculated for the data minus
+    its mean (the offset). For windows with different weights, the terms of the offset multiplied by the weights are
+    added back separately, so that the result is exact apart from rounding.
+
+    The results agree with _calculate_weighted_windows_direct within floating point rounding of the FFT. The absolute
+    error is typically <1e-12 * max(abs(data * window)) * sqrt(window_length) for mean and sum. For std, the
+    relative error is typically <1e-9, and increases where the standard deviation of a slice is very small compared
+    to the spread of the data around the offset. Slices without any values give NaN for mean and std, and exactly 0
+    for sum, as in the direct engine. Infinite values would spread through the whole FFT block, and are excluded from
+    the FFT. The few slices that contain them are calculated by _calculate_weighted_windows_direct.
+
+    The FFT and the moments are always calculated in float64, as float32 rounding errors of the FFT and of the
+    difference of moments for std would be much larger than the float32 rounding of the direct engine. The output
+    is converted to the dtype of data_array.
+
+    Parameters and returns are as in _calculate_weighted_windows_direct. The FFT length (nfft) is chosen from the
+    data length, unless it is given. The offset for std is the mean of data_array (see _get_fft_offset), unless it is
+    given (e.g. the mean of the full data, for chunks of a parallel calculation).
+    """
+    if _get_quantile(statistic) is not None:
+        raise ValueError("The 'fft' engine cannot calculate the '{}' statistic. \nPlease use the 'direct' or "
+                         "'auto' engine for the median, min, max and quantiles.".format(statistic))
+    window = compile_window(window)
+    window_length = window.window_length
+    padded_array = _pad_data(data_array, window_length) if pad else data_array
+    data_series_len = len(padded_array) - window_length + 1
+    output_dtype = padded_array.dtype
+    # an empty data series gives an empty output
+    if data_series_len == 0:
+        return np.empty((0,) + data_array.shape[1:], dtype=output_dtype) if out is None else out
+    padded_array = padded_array.astype(float, copy=False)
+
+    # replace NaN and infinite values in data and window with 0, and keep track of the positions with finite values
+    data_valid = np.isfinite(padded_array)
+    data_zeroed = np.where(data_valid, padded_array, 0.0)
+
+    # number of values in each slice. Correlation of 0/1 arrays gives integers, apart from FFT rounding.
+    count = np.rint(_fft_correlate(data_valid.astype(float), window.count_kernel, data_series_len, nfft))
+    # sum of the weighted values in each slice
+    weighted_sum = _fft_correlate(data_zeroed, window.window_zeroed, data_series_len, nfft)
+    weighted_sum[count == 0] = 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if statistic == "sum":
+            output_array = weighted_sum
+        elif statistic == "mean":
+            output_array = weighted_sum / count
+        elif statistic == "std":
+            if offset is None:
+                offset = _get_fft_offset(padded_array)
+            # deviations from the offset, with 0 for missing values
+            data_centred = np.where(data_valid, padded_array - offset, 0.0)
+            centred_sum = _fft_correlate(data_centred, window.window_zeroed, data_series_len, nfft)
+            centred_sum_sq = _fft_correlate(data_centred ** 2, window.window_zeroed_sq, data_series_len, nfft)
+            # sum of squared deviations of the weighted values from their mean in each slice
+            sum_sq_dev = centred_sum_sq - centred_sum ** 2 / count
+            if len(window.unique_weights) > 1:
+                # the weighted offsets (weight * offset) differ between positions, and add to the spread
+                centred_cross = _fft_correlate(data_centred, window.window_zeroed_sq, data_series_len, nfft)
+                weight_sum, weight_spread = _get_fft_weight_spread(data_valid, window, data_series_len, nfft)
+                sum_sq_dev += (2 * offset * (centred_cross - centred_sum * weight_sum / count)
+                               + offset ** 2 * weight_spread / count)
+            variance = sum_sq_dev / (count - 1)
+            # negative variance can only be caused by rounding errors
+            output_array = np.sqrt(np.clip(variance, 0.0, None))
+            output_array[count < 2] = np.nan
+    if statistic == "mean":
+        output_array[count == 0] = np.nan
+
+    # slices with infinite values are calculated by the direct engine
+    data_infinite = np.isinf(padded_array)
+    if data_infinite.any():
+        infinite_count = _fft_correlate(data_infinite.astype(float), window.count_kernel, data_series_len, nfft)
+        infinite_rows = (np.rint(infinite_count) > 0).reshape(data_series_len, -1).any(axis=1)
+        edges = np.diff(np.concatenate([[0], infinite_rows.astype(int), [0]]))
+        for start, end in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            output_array[start:end] = _calculate_weighted_windows_direct(padded_array[start:end + window_length - 1],
+                                                                         window, statistic, pad=False)
+
+    if progress is not None:
+        progress(data_series_len, data_series_len)
+
+    if out is not None:
+        out[...] = output_array
+        return out
+    return output_array.astype(output_dtype, copy=False)
+
+
+def _weighted_windows_kernel(padded_array, positions, weights, statistic_code, output_array):
+    """ Single-pass kernel of the numba engine, compiled by _get_numba_kernel.
+
+    For each output position i and column, the values padded_array[i + positions] are read once. NaN values are
+    skipped. The weighted values are summed, and for the std (statistic_code 1), the mean and sum of squared
+    deviations are updated with Welford's algorithm, which avoids the cancellation of the difference of moments.
+    The statistic_code is 0 for mean, 1 for std (ddof=1) and 2 for sum. Values are accumulated in float64.
+
+    The kernel is plain python, and gives the same results without compilation (but is very slow).
+    """
+    for column in range(padded_array.shape[1]):
+        for i in range(output_array.shape[0]):
+            count = 0
+            total = 0.0
+            mean = 0.0
+            sum_sq_dev = 0.0
+            for k in range(len(positions)):
+                value = padded_array[i + positions[k], column]
+                # NaN is the only value that is not equal to itself
+                if value == value:
+                    weighted_value = value * weights[k]
+                    count += 1
+                    total += weighted_value
+                    if statistic_code == 1:
+                        delta = weighted_value - mean
+                        mean += delta / count
+                        sum_sq_dev += delta * (weighted_value - mean)
+            if statistic_code == 0:
+                output_array[i, column] = total / count if count > 0 else np.nan
+            elif statistic_code == 1:
+                output_array[i, column] = np.sqrt(sum_sq_dev / (count - 1)) if count > 1 else np.nan
+            else:
+                output_array[i, column] = total
+
+
+@functools.lru_cache(maxsize=None)
+def _get_numba_kernel():
+    """ Compile _weighted_windows_kernel with numba, on first use. Returns None if numba is not installed."""
+    try:
+        import numba
+    except ImportError:
+        return None
+    # nogil allows parallel chunks to run on separate cores, and cache saves the compiled kernel for later sessions
+    return numba.njit(nogil=True, cache=True)(_weighted_windows_kernel)
+
+
+def _calculate_weighted_windows_numba(data_array, window, statistic, progress=None, pad=True, out=None):
+    """ Single-pass weighslide engine, using a kernel compiled with numba.
+
+    Each slice is read once, and only the positions of the window that are not "x" are visited, so sparse windows
+    (e.g. "9xxxxx9xxxxx9") cost as much as a window of their non-"x" positions. The mean, sum and std are calculated
+    in a single sweep, without creating a temporary array of multiplied slices. See _weighted_windows_kernel.
+    The output has the dtype of data_array. The results agree with _calculate_weighted_windows_direct within
+    floating point rounding. Order statistics are calculated by _calculate_weighted_windows_order.
+
+    Parameters and returns are as in _calculate_weighted_windows_direct. Raises an ImportError if numba is not
+    installed.
+    """
+    quantile = _get_quantile(statistic)
+    if quantile is not None:
+        return _calculate_weighted_windows_order(data_array, window, quantile, progress, pad, out)
+
+    kernel = _get_numba_kernel()
+    if kernel is None:
+        raise ImportError("The 'numba' engine requires the numba package. \nPlease install numba, or use the "
+                          "'direct', 'fft' or 'auto' engine.")
+
+    window = compile_window(window)
+    window_length = window.window_length
+    padded_array = _pad_data(data_array, window_length) if pad else data_array
+    data_series_len = len(padded_array) - window_length + 1
+    output_array = np.empty((data_series_len,) + data_array.shape[1:], dtype=padded_array.dtype) if out is None else out
+
+    # the kernel processes 2D arrays with one data series per column. Adding an axis never copies the data, so that
+    # the kernel writes directly into output_array (memmaps are viewed as plain arrays).
+    padded_2d = padded_array if padded_array.ndim == 2 else padded_array[:, np.newaxis]
+    output_2d = np.asarray(output_array)
+    output_2d = output_2d if output_2d.ndim == 2 else output_2d[:, np.newaxis]
+    statistic_code = ["mean", "std", "sum"].index(statistic)
+    # number of positions processed in each call of the kernel, for the progress report
+    block_size = max(1, _BLOCK_ELEMENTS // (max(1, window.valid_count) * padded_2d.shape[1]))
+
+    for start in range(0, data_series_len, block_size):
+        end = min(start + block_size, data_series_len)
+        kernel(padded_2d[start:end + window_length - 1], window.positions, window.weights, statistic_code,
+               output_2d[start:end])
+        if progress is not None:
+            progress(end, data_series_len)
+
+    return output_array
+
+
+def _calculate_weighted_windows_2d_direct(data_array, window_array, statistic, progress=None):
+    """ Weighslide engine for 2D windows, adding the weighted values for each position of the window.
+
+    For each position of the window that is not "x", the weighted values of all slices are a shifted view of the
+    padded matrix multiplied by a single weight, and are added to the output. The matrix is processed in blocks of
+    rows, so that memory use is bounded for large matrices. The standard deviation (ddof=1) is calculated in a
+    second pass around the mean, as in np.nanstd. Slices without any values give NaN for mean and std, and 0 for sum.
+
+    Parameters
+    ----------
+    data_array : np.ndarray
+        2D float array of input data.
+    window_array : np.ndarray
+        2D float array of weights, with an odd number of rows and columns.
+    statistic : string
+        "mean", "std", or "sum".
+    progress : function
+        If given, called as progress(rows_done, rows_total) after each block of rows.
+
+    Returns
+    -------
+    output_array : np.ndarray
+        Float array of the same shape as data_array.
+    """
+    window_rows, window_cols = window_array.shape
+    n_rows, n_cols = data_array.shape
+    # pad the rows, and then the columns, with np.nan
+    padded_array = _pad_data(_pad_data(data_array, window_rows).T, window_cols).T
+    # positions and weights of the window that are not "x"
+    window_positions = [(i, j, window_array[i, j]) for i in range(window_rows) for j in range(window_cols)
+                        if not np.isnan(window_array[i, j])]
+
+    output_array = np.empty(data_array.shape, dtype=float)
+    # the block is used once for each position of the window. Small blocks remain in the CPU cache, which is
+    # about twice as fast as blocks of _BLOCK_ELEMENTS.
+    block_size = max(1, (_BLOCK_ELEMENTS // 16) // max(1, n_cols))
+    for start in range(0, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        padded_block = padded_array[start:end + window_rows - 1]
+        data_valid = ~np.isnan(padded_block)
+        data_zeroed = np.where(data_valid, padded_block, 0.0)
+
+        count = np.zeros((end - start, n_cols))
+        weighted_sum = np.zeros((end - start, n_cols))
+        # temporary array for the weighted values, reused for all positions of the window
+        weighted_values = np.empty((end - start, n_cols))
+        for i, j, weight in window_positions:
+            count += data_valid[i:i + end - start, j:j + n_cols]
+            np.multiply(data_zeroed[i:i + end - start, j:j + n_cols], weight, out=weighted_values)
+            weighted_sum += weighted_values
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if statistic == "sum":
+                output_array[start:end] = weighted_sum
+            elif statistic == "mean":
+                output_array[start:end] = np.where(count > 0, weighted_sum / count, np.nan)
+            elif statistic == "std":
+                mean = weighted_sum / count
+                sum_sq_dev = np.zeros((end - start, n_cols))
+                for i, j, weight in window_positions:
+                    np.multiply(data_zeroed[i:i + end - start, j:j + n_cols], weight, out=weighted_values)
+                    weighted_values -= mean
+                    # missing values do not contribute to the sum of squared deviations
+                    weighted_values *= data_valid[i:i + end - start, j:j + n_cols]
+                    weighted_values *= weighted_values
+                    sum_sq_dev += weighted_values
+                output_array[start:end] = np.where(count > 1, np.sqrt(sum_sq_dev / (count - 1)), np.nan)
+        if progress is not None:
+            progress(end, n_rows)
+
+    return output_array
+
+
+def _fft_correlate_2d(padded_array, kernel, output_shape):
+    """ Correlate the padded matrix with a 2D kernel, using FFTs of blocks of rows (overlap-save).
+
+    Returns an array of output_shape, where position (i, j) is the sum of kernel * the slice of padded_array
+    starting at (i, j). Neither input may contain NaN.
+    """
+    kernel_rows, kernel_cols = kernel.shape
+    n_rows, n_cols = output_shape
+    # all columns are transformed together
+    nfft_cols = _get_fft_length(n_cols + kernel_cols - 1)
+    # the rows are transformed in blocks, so that memory use is bounded for large matrices
+    nfft_rows_min = max(4 * kernel_rows, _BLOCK_ELEMENTS // nfft_cols)
+    nfft_rows = _get_fft_length(min(nfft_rows_min, n_rows + kernel_rows - 1))
+    block_size = nfft_rows - kernel_rows + 1
+    nfft_shape = (nfft_rows, nfft_cols)
+    # reverse the kernel, so that the convolution gives the sliding-window sum
+    kernel_fft = np.fft.rfft2(kernel[::-1, ::-1], nfft_shape)
+
+    output_array = np.empty(output_shape, dtype=float)
+    for start in range(0, n_rows, block_size):
+        end = min(start + block_size, n_rows)
+        segment = padded_array[start:end + kernel_rows - 1]
+        convolved = np.fft.irfft2(np.fft.rfft2(segment, nfft_shape) * kernel_fft, nfft_shape)
+        # the first kernel_rows - 1 rows and kernel_cols - 1 columns are affected by circular wrap-around
+        output_array[start:end] = convolved[kernel_rows - 1:kernel_rows - 1 + end - start,
+                                            kernel_cols - 1:kernel_cols - 1 + n_cols]
+    return output_array
+
+
+def _get_fft_length(n):
+    """ Get the smallest FFT length of at least n, that is a product of the factors 2, 3 and 5 only.
+
+    FFTs of these lengths are fast, and are much shorter than the next power of two for large matrices
+    (e.g. 5120 instead of 8192 for n=5004).
+    """
+    fft_length = 1 << int(np.ceil(np.log2(n)))
+    power_of_5 = 1
+    while power_of_5 < fft_length:
+        power_of_3_and_5 = power_of_5
+        while power_of_3_and_5 < fft_length:
+            # multiply by the smallest power of two reaching n
+            candidate = power_of_3_and_5 * (1 << max(0, int(np.ceil(np.log2(n / power_of_3_and_5)))))
+            fft_length = min(fft_length, candidate)
+            power_of_3_and_5 *= 3
+        power_of_5 *= 5
+    return fft_length
+
+
+def _calculate_weighted_windows_2d_fft(data_array, window_array, statistic, progress=None):
+    """ Convolution-based weighslide engine for 2D windows.
+
+    The number of values, and the first and second moments of the weighted values in each slice, are calculated by
+    2D FFT correlation, as in _calculate_weighted_windows_fft. For the std, the moments are calculated for the data
+    minus the mean of the matrix, and the spread of the weights is added back separately, as in
+    _calculate_weighted_windows_fft. Parameters and returns are as in _calculate_weighted_windows_2d_direct.
+    """
+    window_rows, window_cols = window_array.shape
+    padded_array = _pad_data(_pad_data(data_array, window_rows).T, window_cols).T
+
+    # replace NaN in data and window with 0, and keep track of the positions with values
+    data_valid = ~np.isnan(padded_array)
+    window_valid = ~np.isnan(window_array)
+    data_zeroed = np.where(data_valid, padded_array, 0.0)
+    window_zeroed = np.where(window_valid, window_array, 0.0)
+
+    count = np.rint(_fft_correlate_2d(data_valid.astype(float), window_valid.astype(float), data_array.shape))
+    weighted_sum = _fft_correlate_2d(data_zeroed, window_zeroed, data_array.shape)
+    weighted_sum[count == 0] = 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if statistic == "sum":
+            output_array = weighted_sum
+        elif statistic == "mean":
+            output_array = np.where(count > 0, weighted_sum / count, np.nan)
+        elif statistic == "std":
+            # deviations from the mean of the matrix, with 0 for missing values
+            offset = _get_fft_offset(padded_array.ravel())
+            data_centred = np.where(data_valid, padded_array - offset, 0.0)
+            centred_sum = _fft_correlate_2d(data_centred, window_zeroed, data_array.shape)
+            centred_sum_sq = _fft_correlate_2d(data_centred ** 2, window_zeroed ** 2, data_array.shape)
+            # sum of squared deviations of the weighted values from their mean in each slice
+            sum_sq_dev = centred_sum_sq - centred_sum ** 2 / count
+            unique_weights = np.unique(window_array[window_valid])
+            if len(unique_weights) > 1:
+                # the weighted offsets (weight * offset) differ between positions, and add to the spread
+                centred_cross = _fft_correlate_2d(data_centred, window_zeroed ** 2, data_array.shape)
+                valid_array = data_valid.astype(float)
+                if len(unique_weights) > _MAX_UNIQUE_WEIGHTS:
+                    weight_sum = _fft_correlate_2d(valid_array, window_zeroed, data_array.shape)
+                    weight_spread = (count * _fft_correlate_2d(valid_array, window_zeroed ** 2, data_array.shape)
+                                     - weight_sum ** 2)
+                else:
+                    weight_counts = [np.rint(_fft_correlate_2d(valid_array, (window_array == weight).astype(float),
+                                                               data_array.shape)) for weight in unique_weights]
+                    weight_sum, weight_spread = _get_weight_spread(weight_counts, unique_weights)
+                sum_sq_dev += (2 * offset * (centred_cross - centred_sum * weight_sum / count)
+                               + offset ** 2 * weight_spread / count)
+            variance = sum_sq_dev / (count - 1)
+            # negative variance can only be caused by rounding errors
+            output_array = np.where(count > 1, np.sqrt(np.clip(variance, 0.0, None)), np.nan)
+
+    if progress is not None:
+        progress(len(data_array), len(data_array))
+
+    return output_array
+
+
+def _calculate_weighted_windows_parallel(data_array, window, statistic, engine, workers, progress=None,
+                                         out=None):
+    """ Split the data into chunks, and calculate the chunks in a pool of threads.
+
+    Each chunk is a view of the padded data, including the (window_length - 1) / 2 values on each side that are
+    needed for the slices at the edges of the chunk, so the input is shared by all threads and never copied. numpy
+    and pandas release the GIL during the calculation, so the threads run on separate cores.
+
+    The output is bit-identical to the calculation in a single thread. The direct and numba engines calculate each
+    position independently. For the fft engine, the chunks start at multiples of the FFT block size, and use the FFT
+    length of the full data, so that every FFT block is identical to a block of the single-threaded calculation.
+
+    Parameters
+    ----------
+    data_array : np.ndarray
+        1D float array of input data, or 2D array with one data series per column.
+    window : WeighslideWindow or np.ndarray
+        Compiled window, or 1D float array of weights of odd length, with np.nan for ignored positions.
+    statistic : string
+        Statistic applied to the weighted slices. See calculate_weighted_windows.
+    engine : string
+        "direct", "fft" or "numba".
+    workers : int
+        Number of threads.
+    progress : function
+        If given, called as progress(positions_done, positions_total) after each chunk.
+    out : np.ndarray
+        If given, each chunk is written directly into its part of this array (or memmap), which is returned.
+
+    Returns
+    -------
+    output_array : np.ndarray
+        Float array of the same shape and dtype as data_array.
+    """
+    window = compile_window(window)
+    window_length = window.window_length
+    data_series_len = len(data_array)
+    padded_array = _pad_data(data_array, window_length)
+
+    if engine == "fft":
+        nfft, block_size = _get_fft_block(data_series_len, window_length)
+        offset = None
+        if statistic == "std":
+            # all chunks use the offset of the full data, so that the result does not depend on the chunks
+            offset = _get_fft_offset(padded_array.astype(float, copy=False))
+        calculate = functools.partial(_calculate_weighted_windows_fft, nfft=nfft, offset=offset)
+    elif engine == "numba":
+        block_size = 1
+        calculate = _calculate_weighted_windows_numba
+    else:
+        block_size = 1
+        calculate = _calculate_weighted_windows_direct
+
+    # several chunks per thread, so that threads finishing early can take over the remaining chunks
+    chunk_size = int(np.ceil(data_series_len / (4 * workers)))
+    chunk_size = max(block_size, int(np.ceil(chunk_size / block_size)) * block_size)
+
+    output_array = np.empty(data_array.shape, dtype=data_array.dtype) if out is None else out
+
+    def calculate_chunk(start):
+        end = min(start + chunk_size, data_series_len)
+        calculate(padded_array[start:end + window_length - 1], window, statistic, pad=False,
+                  out=output_array[start:end])
+        return end - start
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(calculate_chunk, start) for start in range(0, data_series_len, chunk_size)]
+        positions_done = 0
+        for future in as_completed(futures):
+            positions_done += future.result()
+            if progress is not None:
+                progress(positions_done, data_series_len)
+
+    return output_array
+
+
+def _choose_engine(data_series_len, window_length, statistic="mean"):
+    """ Select the engine with the lowest expected cost for the given data, window length and statistic."""
+    # order statistics (median, min, max and quantiles) cannot be calculated by convolution
+    if _get_quantile(statistic) is not None:
+        return "direct"
+    # the cost of the direct engine increases with data_series_len * window_length, the FFT engine with
+    # data_series_len * log(window_length). Short data series are fast in either engine.
+    if window_length >= _FFT_MIN_WINDOW_LENGTH and data_series_len >= window_length:
+        return "fft"
+    # the compiled kernel of the numba engine is used for long series where numba is installed. numba is not imported
+    # here, as the import and compilation take longer than the direct engine for short series.
+    if data_series_len >= _NUMBA_MIN_SERIES_LENGTH and _numba_is_installed():
+        return "numba"
+    return "direct"
+
+
+@functools.lru_cache(maxsize=None)
+def _numba_is_installed():
+    """ Check if numba is installed, without importing it."""
+    return importlib.util.find_spec("numba") is not None
+
+
+def _get_band_dataframe(slice_array, missing_value):
+    """ Arrange the slices in a dataframe, with each slice located at the original positions of the data.
+
+    Each column ("window 0", "window 1", etc.) contains one slice.
+    The index runs from -extension_each_side to data_series_len + extension_each_side - 1.
+    Within each slice, missing values are replaced by missing_value (e.g. "nodata").
+    Positions outside the slice are NaN.
+
+    Parameters
+    ----------
+    slice_array : np.ndarray
+        Float array of shape (data_series_len, window_length).
+    missing_value : string
+        Text used for NaN values within the slice.
+
+    Returns
+    -------
+    df : pd.DataFrame
+    """
+    data_series_len, window_length = slice_array.shape
+    if _band_is_too_large(data_series_len, window_length):
+        raise ValueError("The dataframes of slices would contain {} x {} cells, which is too large for memory. \n"
+                         "Please use full_output=False in calculate_weighted_windows, or a binary output_format "
+                         "(e.g. 'npy') in run_weighslide.".format(data_series_len + window_length - 1,
+                                                                   data_series_len))
+    extension_each_side = int((window_length - 1) / 2)
+
+    # row and column of each value in the band of the 2D array
+    cols = np.repeat(np.arange(data_series_len), window_length)
+    rows = cols + np.tile(np.arange(window_length), data_series_len)
+
+    index = pd.RangeIndex(-extension_each_side, data_series_len + extension_each_side)
+    columns = ["window {}".format(i) for i in range(data_series_len)]
+
+    values = slice_array.ravel().astype(object)
+    values[np.isnan(slice_array.ravel())] = missing_value
+    band_array = np.full((len(index), data_series_len), np.nan, dtype=object)
+    band_array[rows, cols] = values
+    return pd.DataFrame(band_array, index=index, columns=columns)
+
+
+def _band_is_too_large(data_series_len, window_length):
+    """ Check if the dataframes of slices of _get_band_dataframe would be too large for memory.
+
+    Each dataframe has one column per position, and one row per padded position, so that its size increases with the
+    square of the data length. Above _BAND_MAX_CELLS cells (e.g. about 10000 positions), the dataframes are not
+    created.
+    """
+    return data_series_len * (data_series_len + window_length - 1) > _BAND_MAX_CELLS
+
+
+def get_parser():
+    """ Create a parser object to read user inputs from the command line."""
+    parser = argparse.ArgumentParser()
+
+    # add command-line options
+    parser.add_argument("w",  # "--window",
+                        help="Sliding weighted window. Can be either a python list "
+                             "(e.g. [0.3,1.0,0.3,0,0.3,1.0,0.3,0,0.3,1.0,0.3]), or a list of numbers that will be "
+                             "converted to a python list (e.g. 393x393x393), where x represents positions that are ignored"
+                             "and 9 represents positions that are most highly weighted.")
+    parser.add_argument("s",  # "--statistic",
+                        default="mean",
+                        type=_get_statistic_argument,
+                        help="The choices are mean, std, sum, median, min, max, or a quantile (e.g. q90 for the 90th "
+                             "percentile). Desired method to reduce the weighted values in the to a "
+                             "single value at the central position.")
+    parser.add_argument("-r",  # "--rawdata",
+                        default=None,
+                        help='Raw data input in the command line. Should be a python list of integers (e.g. "[1,3,5,7,2,4]")'
+                             ' or floats (e.g. "[1.1,3.4,5.2,7.8,2.7,4.5]")')
+    parser.add_argument("-i",  # "-infile",
+                        default=None,
+                        help=r'Full path of file containing original data in csv or excel format.'
+                             r'E.g. "C:/Path/to/your/file.xlsx"')
+    parser.add_argument("-n",  # "--name",
+                        default="",
+                        help="Name of dataset. Should not be longer than 20 characters. Used in output filenames.")
+    parser.add_argument("-c",  # "--column",
+                        default=None,
+                        help='Column name in input file that should be used for analysis. E.g. "data values". '
+                             'Multiple columns can be given as a python list (e.g. "[\'rep1\',\'rep2\']"), or as "all" '
+                             'for all numeric columns.')
+    parser.add_argument("-g",  # "--group_column",
+                        default=None,
+                        help='Column name with the ID of each data series, for input files with many series stacked '
+                             'in one table (e.g. "protein"). Windows do not cross the boundaries between series.')
+    parser.add_argument("-j",  # "--workers",
+                        type=int, default=None,
+                        help="Number of threads used to calculate long data series in parallel.")
+    parser.add_argument("-o",  # "--overwrite",
+                        type=str, default="False",
+                        help='If True, existing files will be overwritten.')
+    parser.add_argument("-e",  # "--excel_kwargs",
+                        default="None",
+                        help="Keyword arguments in python dictionary format to be used when opening "
+                             "an excel file using the python pandas module. (E.g. {'sheet_name':'orig_data'}")
+    parser.add_argument("-k",  # "--csv_kwargs",
+                        default=None,
+                        help="Keyword arguments in python dictionary format to be used when opening "
+                             "your csv file using the python pandas module. (E.g. {'delimeter':',','header'='infer'}")
+    parser.add_argument("-f",  # "--output_format",
+                        default="csv", choices=["csv", "parquet", "feather", "npy"],
+                        help="Format of the output data files. Binary formats (parquet, feather, npy) are much faster "
+                             "than csv for long datasets.")
+    parser.add_argument("-x",  # "--excel",
+                        type=str, default="True",
+                        help="If False, the excel output file is not saved.")
+    parser.add_argument("-p",  # "--plot",
+                        type=str, default="True",
+                        help="If False, the png figure is not saved.")
+
+    return parser
+
+
+def main(argv=None):
+    """ Run weighslide from the command line."""
+    print("\nTo view the help:\npython weighslide.py -h\n\nTo test the weighslide module:\n"
+          "python weighslide.py [0.5,1.0,0.5] mean -r [1,3,5,7,2,4,3,5,7,2,4]\n\n")
+    # obtain command-line arguments
+    args = get_parser().parse_args(argv)
+
+    print(args)
+
+    # extract the boolean "overwrite" variable from the input arguments
+    if "o" in args:
+        print(args.o)
+        if args.o in ["True", "true", "TRUE"]:
+            overwrite = True
+        elif args.o in ["False", "false", "FALSE"]:
+            overwrite = False
         else:
             raise ValueError('Overwrite variable "{}" is not recognised. '
                              'Accepted values are "True" or "False".'.format(args.o))
@@ -460,6 +2826,12 @@ if __name__ == '__main__':
         infile = os.path.normpath(args.i)
         # extract the column name from the command-line input
         column = args.c
+        # a list of column names, or "all", is processed in a single calculation
+        columns = None
+        if column == "all":
+            column, columns = None, "all"
+        elif column is not None and column[0] == "[":
+            column, columns = None, ast.literal_eval(column)
         # extract the sample/data name from the command-line input
         name = args.n
         # extract the excel_kwargs from the command-line input
@@ -469,9 +2841,27 @@ if __name__ == '__main__':
             csv_kwargs = ast.literal_eval(args.k)
         else:
             csv_kwargs = None
+        # extract the boolean "excel" variable from the input arguments
+        if args.x in ["True", "true", "TRUE"]:
+            excel = True
+        elif args.x in ["False", "false", "FALSE"]:
+            excel = False
+        else:
+            raise ValueError('Excel variable "{}" is not recognised. '
+                             'Accepted values are "True" or "False".'.format(args.x))
+        # extract the boolean "plot" variable from the input arguments
+        if args.p in ["True", "true", "TRUE"]:
+            plot = True
+        elif args.p in ["False", "false", "FALSE"]:
+            plot = False
+        else:
+            raise ValueError('Plot variable "{}" is not recognised. '
+                             'Accepted values are "True" or "False".'.format(args.p))
         # run weighslide
         run_weighslide(infile=infile, window=window, statistic=statistic, column=column,
-                       name=name, excel_kwargs=excel_kwargs, csv_kwargs=csv_kwargs)
+                       name=name, excel_kwargs=excel_kwargs, csv_kwargs=csv_kwargs, columns=columns,
+                       overwrite=overwrite, output_format=args.f, excel=excel,
+                       plot=plot, group_column=args.g, workers=args.j)
 
     elif args.r is not None:
         # extract the csv_kwargs from the command-line input
@@ -480,9 +2870,13 @@ if __name__ == '__main__':
         raw_data_list = ast.literal_eval(raw_data_user_input)
         # convert the python list to a pandas Series
         raw_data_series = pd.Series(raw_data_list)
-        # run the calculate_weighted_windows function
-        window_array, df_orig_sliced, df_multiplied, output_series = calculate_weighted_windows(raw_data_series,
-                                                                                                window, statistic)
+        # run the calculate_weighted_windows function. The slices are not printed, and are therefore not created.
+        output_series = calculate_weighted_windows(raw_data_series, window, statistic, full_output=False)
         print("\nWeighslide output:")
         # print out the values from the output series
         print(output_series.to_string(index=False, header=False))
+
+
+# if weighslide.py is run as the main python script, obtain the options from the command line.
+if __name__ == '__main__':
+    main()